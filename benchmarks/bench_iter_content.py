@@ -0,0 +1,53 @@
+# -*- coding: utf8 -*-
+"""compare `Proc.iter_content` with the old poll() + read(1) loop
+
+Usage::
+
+    $ python benchmarks/bench_iter_content.py [size_in_mb]
+
+"""
+
+import subprocess
+import sys
+import time
+
+import shcmd
+
+
+def legacy_iter_content(cmd, chunk_size=1):
+    proc = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    while proc.poll() is None:
+        chunk = proc.stdout.read(chunk_size)
+        if not chunk:
+            continue
+        yield chunk
+    chunk = proc.stdout.read(chunk_size)
+    while chunk:
+        yield chunk
+        chunk = proc.stdout.read(chunk_size)
+    proc.stderr.read()
+
+
+def shcmd_iter_content(cmd):
+    return shcmd.run(cmd, stream=True).iter_content()
+
+
+def measure(name, iterator):
+    wall, cpu = time.time(), time.process_time()
+    total = sum(len(chunk) for chunk in iterator)
+    wall, cpu = time.time() - wall, time.process_time() - cpu
+    print("{0:>8}: {1:>10} bytes {2:>10.1f} MB/s cpu {3:.3f}s".format(
+        name, total, total / wall / 1024 / 1024, cpu
+    ))
+
+
+def main(size_mb):
+    cmd = ["head", "-c", str(size_mb * 1024 * 1024), "/dev/zero"]
+    measure("legacy", legacy_iter_content(cmd))
+    measure("selector", shcmd_iter_content(cmd))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8)
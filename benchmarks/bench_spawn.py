@@ -0,0 +1,62 @@
+# -*- coding: utf8 -*-
+"""spawns per second from a parent with a large heap
+
+compare plain fork (forced by a no-op preexec_fn), the default
+`subprocess.Popen` and `shcmd.run` which lets subprocess use posix_spawn
+
+Usage::
+
+    $ python benchmarks/bench_spawn.py [heap_in_mb] [spawns]
+
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import shcmd
+
+
+def fork_spawn():
+    subprocess.Popen(
+        ["true"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        preexec_fn=lambda: None
+    ).communicate()
+
+
+def popen_spawn():
+    subprocess.Popen(
+        ["true"], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    ).communicate()
+
+
+def shcmd_spawn():
+    shcmd.run(["true"], env=os.environ)
+
+
+def measure(name, spawn, count):
+    started_at = time.time()
+    for __ in range(count):
+        spawn()
+    elapsed = time.time() - started_at
+    print("{0:>6}: {1:>8.1f} spawns/s".format(name, count / elapsed))
+
+
+def main(heap_mb, count):
+    # touch every page, so they are really mapped in the parent
+    heap = bytearray(heap_mb * 1024 * 1024)
+    for offset in range(0, len(heap), resource.getpagesize()):
+        heap[offset] = 1
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+    print("parent rss: {0} MB".format(rss))
+
+    measure("fork", fork_spawn, count)
+    measure("popen", popen_spawn, count)
+    measure("shcmd", shcmd_spawn, count)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [2048, 500][len(args):]))
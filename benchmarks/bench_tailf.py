@@ -0,0 +1,64 @@
+# -*- coding: utf8 -*-
+"""line latency and cpu time of `tailf`, inotify vs polling
+
+a writer thread appends a timestamped line every `interval` seconds,
+the reader measures how long each line takes to come out of `tailf`
+
+Usage::
+
+    $ python benchmarks/bench_tailf.py [lines] [interval]
+
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import shcmd
+
+
+def writer(path, lines, interval):
+    with open(path, "at") as f:
+        for __ in range(lines):
+            time.sleep(interval)
+            f.write("{0!r}\n".format(time.time()))
+            f.flush()
+        f.write("stop\n")
+
+
+def measure(name, path, lines, interval, inotify):
+    thread = threading.Thread(target=writer, args=(path, lines, interval))
+    cpu = time.process_time()
+    thread.start()
+    latency = []
+    for line in shcmd.tailf(
+        path, timeout=-1, stopon=lambda x: x == "stop\n", inotify=inotify
+    ):
+        if line != "stop\n":
+            latency.append(time.time() - float(line))
+    thread.join()
+    cpu = time.process_time() - cpu
+    latency.sort()
+    print("{0:>8}: latency median {1:.4f}s max {2:.4f}s cpu {3:.3f}s".format(
+        name, latency[len(latency) // 2], latency[-1], cpu
+    ))
+
+
+def main(lines, interval):
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        measure("polling", path, lines, interval, inotify=False)
+        measure("inotify", path, lines, interval, inotify=True)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if args else 50,
+        float(args[1]) if len(args) > 1 else 0.05
+    )
@@ -0,0 +1,68 @@
+# -*- coding: utf8 -*-
+"""peak memory and throughput of `TarGenerator`, streamed vs buffered,
+and `generate_to` which lets the kernel move file data
+
+the tree is made of sparse files, so a 5GB tree takes no disk space,
+streaming runs first since max rss of a process never goes down
+
+Usage::
+
+    $ python benchmarks/bench_tar.py [total_in_mb] [file_in_mb]
+
+"""
+
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from shcmd.tar import TarGenerator
+
+
+def make_tree(root, total_mb, file_mb):
+    for index in range(max(1, total_mb // file_mb)):
+        subdir = os.path.join(root, "{0:03d}".format(index // 100))
+        if not os.path.isdir(subdir):
+            os.mkdir(subdir)
+        with open(os.path.join(subdir, str(index)), "wb") as f:
+            f.truncate(file_mb * 1024 * 1024)
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+
+def measure(name, root, stream, to_fd=None):
+    tg = TarGenerator(stream=stream)
+    tg.files_to_add = [root]
+    started_at = time.time()
+    size = 0
+    if to_fd is not None:
+        size = tg.generate_to(to_fd)
+    else:
+        for data in tg.generate():
+            size += len(data)
+    elapsed = time.time() - started_at
+    print("{0:>8}: {1:>8.1f} MB/s, max rss {2} MB".format(
+        name, size / elapsed / 1024 / 1024, max_rss_mb()
+    ))
+
+
+def main(total_mb, file_mb):
+    root = tempfile.mkdtemp()
+    try:
+        make_tree(root, total_mb, file_mb)
+        print("start rss: {0} MB".format(max_rss_mb()))
+        measure("stream", root, stream=True)
+        with open(os.devnull, "wb") as devnull:
+            measure("sendfile", root, stream=True, to_fd=devnull)
+        measure("buffered", root, stream=False)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [5120, 64][len(args):]))
@@ -0,0 +1,60 @@
+# -*- coding: utf8 -*-
+"""files per second of `TarGenerator` on many small files,
+with and without the read-ahead pool
+
+pass a dir on a network filesystem to measure it there, page cache
+hides disk latency, so drop caches between runs for cold disk numbers::
+
+    # sync && echo 3 > /proc/sys/vm/drop_caches
+
+Usage::
+
+    $ python benchmarks/bench_tar_prefetch.py [files] [threads] [dir]
+
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from shcmd.tar import TarGenerator
+
+
+def make_files(root, count):
+    for index in range(count):
+        subdir = os.path.join(root, "{0:03d}".format(index // 1000))
+        if not os.path.isdir(subdir):
+            os.mkdir(subdir)
+        with open(os.path.join(subdir, str(index)), "wb") as f:
+            f.write(os.urandom(4096))
+
+
+def measure(name, root, count, prefetch):
+    tg = TarGenerator(stream=True, prefetch=prefetch)
+    tg.files_to_add = [root]
+    started_at = time.time()
+    for __ in tg.generate():
+        pass
+    elapsed = time.time() - started_at
+    print("{0:>10}: {1:>10.1f} files/s".format(name, count / elapsed))
+
+
+def main(count, threads, parent=None):
+    root = tempfile.mkdtemp(dir=parent)
+    try:
+        make_files(root, count)
+        measure("sequential", root, count, prefetch=0)
+        measure("prefetch", root, count, prefetch=threads)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if args else 100000,
+        int(args[1]) if len(args) > 1 else 8,
+        args[2] if len(args) > 2 else None
+    )
@@ -0,0 +1,77 @@
+# -*- coding: utf8 -*-
+"""stream many commands at once, all of them hitting their timeout
+
+compare the shared scheduler used by `Proc` with one threading.Timer
+per process: peak thread count and how late each kill lands
+
+Usage::
+
+    $ python benchmarks/stress_timeouts.py [streams] [--legacy]
+
+"""
+
+import contextlib
+import os
+import resource
+import selectors
+import subprocess
+import sys
+import threading
+import time
+
+import shcmd
+
+TIMEOUT = 1
+
+
+@contextlib.contextmanager
+def legacy_stream(proc):
+    proc = subprocess.Popen(
+        proc.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    timer = threading.Timer(TIMEOUT, proc.kill)
+    timer.start()
+    try:
+        yield proc
+    finally:
+        timer.cancel()
+
+
+def main(streams, legacy):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    with contextlib.ExitStack() as stack:
+        selector = stack.enter_context(selectors.DefaultSelector())
+        started_at = time.monotonic()
+        for __ in range(streams):
+            proc = shcmd.run("sleep 30", timeout=TIMEOUT, stream=True)
+            if legacy:
+                child = stack.enter_context(legacy_stream(proc))
+            else:
+                child = stack.enter_context(proc._stream())
+            selector.register(
+                child.stdout, selectors.EVENT_READ, time.monotonic()
+            )
+        spawned = time.monotonic() - started_at
+        threads = threading.active_count()
+
+        lateness = []
+        while selector.get_map():
+            for key, __ in selector.select():
+                if not os.read(key.fd, 1024):
+                    selector.unregister(key.fileobj)
+                    lateness.append(time.monotonic() - key.data - TIMEOUT)
+
+    lateness.sort()
+    print("{0}: {1} streams spawned in {2:.2f}s, {3} threads".format(
+        "legacy" if legacy else "scheduler", streams, spawned, threads
+    ))
+    print("kill lateness: median {0:.3f}s max {1:.3f}s".format(
+        lateness[len(lateness) // 2], lateness[-1]
+    ))
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("-")]
+    main(int(args[0]) if args else 1000, "--legacy" in sys.argv)
@@ -57,9 +57,16 @@ setuptools.setup(
         "License :: OSI Approved :: Apache Software License",
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.3",
-        "Programming Language :: Python :: 3.4"
+        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11"
     ],
+    python_requires=">=3.7",
+    extras_require={
+        "zstd": ["zstandard"]
+    },
     setup_requires=["nose >= 1.0"],
     tests_require=tests_require,
     test_suite="nose.collector"
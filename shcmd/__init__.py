@@ -5,30 +5,43 @@ __url__ = "https://github.com/skylothar/shcmd"
 
 import sys
 import os
+import subprocess
+
+from concurrent import futures
 
 version = sys.version_info
-if version.major != 3:
+# async generators and asyncio.get_running_loop of aproc
+if version.major != 3 or version < (3, 7):
     raise ValueError("unsupported python version: {0}".format(version))
 
 __all__ = [
     "cd", "cd_to",
-    "mkdir", "rm", "run", "tailf",
-    "TarGenerator",
+    "mkdir", "rm", "run", "arun", "run_many", "pipe", "tailf", "tailf_many",
+    "tailf_batches",
+    "TarGenerator", "TarExtractor",
     "ShCmdError"
 ]
 
+from .aproc import AsyncProc
 from .cmd import cd, cd_to, mkdir, rm
 from .errors import ShCmdError
+from .pipeline import Pipeline
 from .proc import Proc
 from .tar import TarGenerator
+from .untar import TarExtractor
 from .utils import expand_args
-from .tailf import tailf
+from .tailf import tailf, tailf_batches, tailf_many
 
 
 DEFAULT_TIMEOUT = 60
+DEFAULT_CONCURRENCY = 8
 
 
-def run(cmd, cwd=None, env=None, timeout=None, stream=False, warn_only=False):
+def run(
+    cmd, cwd=None, env=None, timeout=None, stream=False, warn_only=False,
+    capture=True, input=None, spill_threshold=None, keep_tail=None,
+    keep_tail_lines=None
+):
     """
     :param cmd: command to run
     :param cwd: change dir into before execute, default is current dir
@@ -36,14 +49,172 @@ def run(cmd, cwd=None, env=None, timeout=None, stream=False, warn_only=False):
     :param timeout: timeout
     :param stream: stream output, default is False, block until finished
     :param warn_only: default False, set to True to allow unsuccessful result
+    :param capture: default True, set to False to drop stdout once streamed
+    :param input: (optional) bytes, str, file object or iterator of chunks
+        to feed into stdin
+    :param spill_threshold: (optional) bytes of output kept in memory,
+        larger output is spilled into a temporary file
+    :param keep_tail: (optional) only keep the last N bytes of each output,
+        it may cut a multibyte char, use `content` to get the raw bytes
+    :param keep_tail_lines: (optional) only keep the last N lines of each
+        output, can be combined with `keep_tail`
     """
     proc = Proc(
         expand_args(cmd),
-        os.path.realpath(cwd or os.getcwd()),
+        os.path.realpath(cwd) if cwd else None,
+        env=env or {},
+        timeout=timeout or DEFAULT_TIMEOUT,
+        capture=capture,
+        input=input,
+        spill_threshold=spill_threshold,
+        keep_tail=keep_tail,
+        keep_tail_lines=keep_tail_lines
+    )
+
+    if not stream:
+        proc.block(warn_only=warn_only)
+    return proc
+
+
+def pipe(
+    *cmds, cwd=None, env=None, timeout=None, stream=False, warn_only=False,
+    capture=True, input=None, spill_threshold=None, keep_tail=None,
+    keep_tail_lines=None
+):
+    """
+    run commands as a pipeline, like `a | b | c` in shell, returns `Pipeline`
+
+    :param cmds: commands to chain, stdout of each one feeds the next one
+    the rest are the same as `run`, `ok` is True only if every stage succeeds
+
+    Usage::
+
+        >>> proc = shcmd.pipe("cat access.log", "grep GET", "wc -l")
+        >>> proc.return_codes
+        [0, 0, 0]
+
+    """
+    proc = Pipeline(
+        [expand_args(cmd) for cmd in cmds],
+        os.path.realpath(cwd) if cwd else None,
         env=env or {},
-        timeout=timeout or DEFAULT_TIMEOUT
+        timeout=timeout or DEFAULT_TIMEOUT,
+        capture=capture,
+        input=input,
+        spill_threshold=spill_threshold,
+        keep_tail=keep_tail,
+        keep_tail_lines=keep_tail_lines
     )
 
     if not stream:
         proc.block(warn_only=warn_only)
     return proc
+
+
+async def arun(
+    cmd, cwd=None, env=None, timeout=None, stream=False, warn_only=False,
+    capture=True, input=None, spill_threshold=None, keep_tail=None,
+    keep_tail_lines=None
+):
+    """
+    asyncio version of `run`, returns an `AsyncProc`
+
+    Usage::
+
+        >>> proc = await shcmd.arun("ls")
+        >>> proc.ok
+        True
+
+    """
+    proc = AsyncProc(
+        expand_args(cmd),
+        os.path.realpath(cwd) if cwd else None,
+        env=env or {},
+        timeout=timeout or DEFAULT_TIMEOUT,
+        capture=capture,
+        input=input,
+        spill_threshold=spill_threshold,
+        keep_tail=keep_tail,
+        keep_tail_lines=keep_tail_lines
+    )
+
+    if not stream:
+        await proc.block(warn_only=warn_only)
+    return proc
+
+
+def _block_proc(proc, warn_only):
+    try:
+        proc.block(warn_only=True)
+    except subprocess.TimeoutExpired:
+        if not warn_only:
+            raise
+    return proc
+
+
+def run_many(
+    cmds, concurrency=DEFAULT_CONCURRENCY, ordered=True, warn_only=False,
+    timeout=None, capture=True, spill_threshold=None, keep_tail=None,
+    keep_tail_lines=None
+):
+    """
+    run commands in parallel, yields a finished `Proc` for each of them
+
+    :param cmds: commands to run, each one is a command (str, list or tuple)
+        or a dict with key "cmd" and optional "cwd", "env", "timeout"
+        and "input"
+    :param concurrency: max number of commands running at the same time
+    :param ordered: default True, yields in input order,
+        set to False to yield as they complete
+    :param warn_only: default False, stops at the first failed command
+        and raise, commands still running are killed,
+        set to True to collect every result
+        (a timeouted proc is yielded with `ok == False`)
+    :param timeout: timeout for commands that do not set their own
+    :param capture: default True, set to False to drop stdout
+    :param spill_threshold: (optional) bytes of output kept in memory
+    :param keep_tail: (optional) only keep the last N bytes of each output
+    :param keep_tail_lines: (optional) only keep the last N lines of each
+        output
+
+    Usage::
+
+        >>> hosts = ["host0", "host1", "host2"]
+        >>> cmds = [["ping", "-c1", host] for host in hosts]
+        >>> for proc in shcmd.run_many(cmds, concurrency=2, warn_only=True):
+        ...     print(proc.cmd, proc.ok)
+        ...
+
+    """
+    procs = []
+    for cmd in cmds:
+        spec = cmd if isinstance(cmd, dict) else dict(cmd=cmd)
+        procs.append(Proc(
+            expand_args(spec["cmd"]),
+            os.path.realpath(spec["cwd"]) if spec.get("cwd") else None,
+            env=spec.get("env") or {},
+            timeout=spec.get("timeout") or timeout or DEFAULT_TIMEOUT,
+            capture=capture,
+            input=spec.get("input"),
+            spill_threshold=spill_threshold,
+            keep_tail=keep_tail,
+            keep_tail_lines=keep_tail_lines
+        ))
+
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        running = [
+            executor.submit(_block_proc, proc, warn_only) for proc in procs
+        ]
+        try:
+            done = running if ordered else futures.as_completed(running)
+            for future in done:
+                proc = future.result()
+                if not warn_only:
+                    proc.raise_for_error()
+                yield proc
+        finally:
+            for future in running:
+                future.cancel()
+            # do not wait for commands nobody is going to look at
+            for proc in procs:
+                proc._kill()
@@ -0,0 +1,156 @@
+# -*- coding: utf8 -*-
+
+import asyncio
+import subprocess
+
+from .proc import (
+    CONTENT_CHUNK_SIZE, LINE_CHUNK_SIZE, FINISHED, STDOUT, STDERR, Proc,
+    spawn_options
+)
+from .utils import LineSplitter
+
+
+class AsyncProc(Proc):
+    """
+    asyncio flavored `Proc`
+
+    shares the same result interface (ok, stdout, stderr, raise_for_error),
+    but runs the command with `asyncio.create_subprocess_exec`,
+    so no thread is held while the command is running
+    """
+
+    async def _read_stream(self, stream_name, stream, chunk_size, queue):
+        """put (stream, chunk) into queue, (stream, None) when eof"""
+        while True:
+            chunk = await stream.read(chunk_size)
+            if not chunk:
+                break
+            await queue.put((stream_name, chunk))
+        await queue.put((stream_name, None))
+
+    async def _write_stream(self, stream, chunk_size):
+        """feed input into stream, then close it"""
+        try:
+            for chunk in self._iter_input(chunk_size):
+                stream.write(chunk)
+                await stream.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            stream.close()
+
+    async def iter_output(
+        self, chunk_size=CONTENT_CHUNK_SIZE, warn_only=False
+    ):
+        """
+        async version of `Proc.iter_output`
+
+        Usage::
+
+            >>> proc = await shcmd.arun("make", stream=True)
+            >>> async for stream, chunk in proc.iter_output():
+            ...     print(stream, chunk)
+            ...
+
+        """
+        self._state = "not finished"
+        if self.return_code is not None:
+            for stream, chunk in self._replay(chunk_size):
+                yield stream, chunk
+        else:
+            loop = asyncio.get_running_loop()
+            deadline = None
+            if self.timeout is not None:
+                deadline = loop.time() + self.timeout
+
+            def time_left():
+                return None if deadline is None else deadline - loop.time()
+
+            buffers = self._new_buffers()
+            proc = await asyncio.create_subprocess_exec(
+                *self.cmd,
+                stdin=None if self._input is None else subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                **spawn_options(self.cmd, self.cwd, self.env, self.close_fds)
+            )
+            queue = asyncio.Queue(maxsize=len(buffers))
+            readers = [
+                loop.create_task(
+                    self._read_stream(STDOUT, proc.stdout, chunk_size, queue)
+                ),
+                loop.create_task(
+                    self._read_stream(STDERR, proc.stderr, chunk_size, queue)
+                )
+            ]
+            running = len(readers)
+            writer = None
+            if proc.stdin is not None:
+                writer = loop.create_task(
+                    self._write_stream(proc.stdin, chunk_size)
+                )
+                readers.append(writer)
+            try:
+                while running:
+                    stream, chunk = await asyncio.wait_for(
+                        queue.get(), time_left()
+                    )
+                    if chunk is None:
+                        running -= 1
+                        continue
+                    yield stream, chunk
+                    buffers[stream].write(chunk)
+                await asyncio.wait_for(proc.wait(), time_left())
+                if writer is not None:
+                    # raises what the input iterator raised, like `Proc`
+                    await writer
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                self._stdout = buffers[STDOUT].getvalue()
+                self._stderr = buffers[STDERR].getvalue()
+                self._state = "timeouted"
+                raise subprocess.TimeoutExpired(self.cmd, self.timeout)
+            finally:
+                for reader in readers:
+                    reader.cancel()
+
+            self._finish(proc, buffers)
+
+        self._state = FINISHED
+        if not warn_only:
+            self.raise_for_error()
+
+    async def iter_content(
+        self, chunk_size=CONTENT_CHUNK_SIZE, warn_only=False
+    ):
+        """async version of `Proc.iter_content`"""
+        async for stream, chunk in self.iter_output(chunk_size, warn_only):
+            if stream == STDOUT:
+                yield chunk
+
+    async def iter_lines(
+        self, warn_only=False, chunk_size=LINE_CHUNK_SIZE, decode_unicode=True
+    ):
+        """async version of `Proc.iter_lines`"""
+        splitter = LineSplitter(self.codec if decode_unicode else None)
+        async for data in self.iter_content(chunk_size, warn_only=True):
+            for line in splitter.feed(data):
+                yield line
+        for line in splitter.flush():
+            yield line
+
+        self._state = FINISHED
+        if not warn_only:
+            self.raise_for_error()
+
+    async def block(self, warn_only=False):
+        """wait until the command finished."""
+        self._state = "not finished"
+        if self._return_code is None:
+            async for __ in self.iter_output(warn_only=True):
+                pass
+
+        self._state = FINISHED
+        if not warn_only:
+            self.raise_for_error()
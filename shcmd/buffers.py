@@ -0,0 +1,138 @@
+# -*- coding: utf8 -*-
+
+import collections
+import mmap
+import tempfile
+
+
+class ChunkBuffer(object):
+    """
+    collects output chunks in a list, joins them only once when asked
+
+    appending is O(1), so capturing large outputs stays linear
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, chunk):
+        self._chunks.append(chunk)
+
+    def getvalue(self):
+        """all written data in bytes format"""
+        if len(self._chunks) > 1:
+            self._chunks = [b"".join(self._chunks)]
+        return self._chunks[0] if self._chunks else b""
+
+
+class SpillBuffer(object):
+    """
+    keeps output in memory until it grows over `threshold` bytes,
+    then moves it into a temporary file
+
+    when spilled, `getvalue` returns a read-only mmap of the file,
+    which is bytes-like and only pages in what is actually read
+
+    :param threshold: max bytes to keep in memory
+    """
+
+    def __init__(self, threshold):
+        self._threshold = threshold
+        self._memory = ChunkBuffer()
+        self._size = 0
+        self._file = None
+        self._value = None
+
+    @property
+    def spilled(self):
+        """`True` if the data has been moved into a file"""
+        return self._file is not None
+
+    def write(self, chunk):
+        self._value = None
+        self._size += len(chunk)
+        if self._file is None and self._size > self._threshold:
+            self._file = tempfile.TemporaryFile()
+            self._file.write(self._memory.getvalue())
+            self._memory = None
+        if self._file is None:
+            self._memory.write(chunk)
+        else:
+            self._file.write(chunk)
+
+    def getvalue(self):
+        """all written data, bytes or mmap if spilled"""
+        if self._value is not None:
+            return self._value
+        if self._file is None:
+            self._value = self._memory.getvalue()
+        else:
+            self._file.flush()
+            self._value = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        return self._value
+
+
+class TailBuffer(object):
+    """
+    keeps only the tail of the output: the last `maxbytes` bytes and/or
+    the last `maxlines` lines, memory stays bounded however long it runs
+
+    :param maxbytes: (optional) max bytes to keep
+    :param maxlines: (optional) max lines to keep
+    """
+
+    def __init__(self, maxbytes=None, maxlines=None):
+        self._maxbytes = maxbytes
+        self._maxlines = maxlines
+        self._chunks = collections.deque()
+        self._size = 0
+        self._newlines = 0
+
+    def write(self, chunk):
+        if self._maxbytes is not None:
+            chunk = chunk[-self._maxbytes:] if self._maxbytes else b""
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        self._newlines += chunk.count(b"\n")
+        while len(self._chunks) > 1 and not self._needs(self._chunks[0]):
+            dropped = self._chunks.popleft()
+            self._size -= len(dropped)
+            self._newlines -= dropped.count(b"\n")
+
+    def _needs(self, first):
+        """`True` if the tail still reaches into the first chunk"""
+        if self._maxbytes is not None:
+            if self._size - len(first) >= self._maxbytes:
+                return False
+        if self._maxlines is not None:
+            # one more line break to find where the oldest line starts
+            if self._newlines - first.count(b"\n") > self._maxlines:
+                return False
+        return True
+
+    def getvalue(self):
+        """the kept tail in bytes format"""
+        data = b"".join(self._chunks)
+        if self._maxlines is not None:
+            end = len(data) - 1 if data.endswith(b"\n") else len(data)
+            for __ in range(self._maxlines):
+                end = data.rfind(b"\n", 0, end)
+                if end < 0:
+                    break
+            else:
+                data = data[end + 1:]
+        if self._maxbytes is not None:
+            data = data[-self._maxbytes:] if self._maxbytes else b""
+        return data
+
+
+class NullBuffer(object):
+    """drops everything written into it"""
+
+    def write(self, chunk):
+        pass
+
+    def getvalue(self):
+        return b""
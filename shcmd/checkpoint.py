@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 1
+
+
+class Checkpoint(object):
+    """
+    byte offsets of followed files, persisted in a small json file
+    as {path: [device, inode, offset]}
+
+    updates stay in memory, they are written out at most once
+    every `interval` seconds, the file is replaced atomically
+
+    :param path: checkpoint file
+    :param interval: (optional) min seconds between two writes
+    :param fsync: (optional) default False, fsync on every write
+
+    Usage::
+
+        >>> checkpoint = Checkpoint("/var/lib/shipper/offsets.json")
+        >>> for line in tailf("/var/log/app.log", checkpoint=checkpoint):
+        ...     ship(line)
+        ...
+
+    """
+
+    def __init__(self, path, interval=FLUSH_INTERVAL, fsync=False):
+        self.path = path
+        self._interval = interval
+        self._fsync = fsync
+        self._flushed_at = time.monotonic()
+        self._dirty = False
+        self._offsets = {}
+        try:
+            with open(path, "rt", encoding="utf8") as f:
+                self._offsets = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.warning("broken checkpoint [{0}] ignored".format(path))
+
+    def get(self, filepath):
+        """returns ((device, inode), offset) of filepath, or None"""
+        saved = self._offsets.get(os.path.abspath(filepath))
+        if saved is None:
+            return None
+        device, inode, offset = saved
+        return (device, inode), offset
+
+    def update(self, filepath, inode, offset):
+        """record the offset, does not write the file"""
+        saved = [inode[0], inode[1], offset]
+        filepath = os.path.abspath(filepath)
+        if self._offsets.get(filepath) != saved:
+            self._offsets[filepath] = saved
+            self._dirty = True
+
+    @property
+    def due(self):
+        """`True` if the interval since last write has passed"""
+        return time.monotonic() - self._flushed_at >= self._interval
+
+    def flush(self):
+        """write the offsets out if any of them changed"""
+        self._flushed_at = time.monotonic()
+        if not self._dirty:
+            return
+        tmp_path = "{0}.tmp".format(self.path)
+        with open(tmp_path, "wt", encoding="utf8") as f:
+            json.dump(self._offsets, f)
+            if self._fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def close(self):
+        self.flush()
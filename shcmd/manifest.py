@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_hash(path):
+    """sha256 of the file content in hex"""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class Manifest(object):
+    """
+    index of what was put in a tar, in a small json file
+    as {name: [size, mtime_ns, device, inode, sha256 or None]}
+
+    a member is unchanged if its size, mtime and inode are the same,
+    or, with `hash=True`, if its content has the same sha256
+
+    the file is only replaced by `save`, once a tar is fully generated
+
+    :param path: manifest file
+    :param hash: (optional) default False, hash regular files whose
+        stat changed, so touched but identical files are still unchanged
+
+    Usage::
+
+        >>> tg = TarGenerator(manifest="/var/lib/builds/app.manifest")
+        >>> tg.files_to_add = ["/srv/app"]
+        >>> tg.generate_to(sock)
+        >>> tg.deleted
+        ['srv/app/removed.py']
+
+    """
+
+    def __init__(self, path, hash=False):
+        self.path = path
+        self._hash = hash
+        self._old = {}
+        self._new = {}
+        try:
+            with open(path, "rt", encoding="utf8") as f:
+                self._old = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.warning("broken manifest [{0}] ignored".format(path))
+
+    def unchanged(self, path, name, regular):
+        """`True` if the file at path is the same as `name` last time,
+        the current state of it is recorded either way
+        """
+        stat = os.stat(path)
+        entry = [
+            stat.st_size, stat.st_mtime_ns, stat.st_dev, stat.st_ino, None
+        ]
+        old = self._old.get(name)
+        if old is not None and old[:4] == entry[:4]:
+            if self._hash and regular and old[4] is None:
+                # saved without hash, it is needed for the next time
+                old = entry[:4] + [file_hash(path)]
+            self._new[name] = old
+            return True
+        if self._hash and regular:
+            entry[4] = file_hash(path)
+        self._new[name] = entry
+        return old is not None and entry[4] is not None and old[4] == entry[4]
+
+    @property
+    def deleted(self):
+        """names recorded last time but not seen this time"""
+        return sorted(set(self._old).difference(self._new))
+
+    def save(self):
+        """replace the manifest file with what is seen this time"""
+        tmp_path = "{0}.tmp".format(self.path)
+        with open(tmp_path, "wt", encoding="utf8") as f:
+            json.dump(self._new, f)
+        os.replace(tmp_path, self.path)
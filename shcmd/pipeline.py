@@ -0,0 +1,130 @@
+# -*- coding: utf8 -*-
+
+import os
+import subprocess
+
+from .proc import Proc, spawn_options
+
+
+class PipelineProcess(object):
+    """
+    a group of `subprocess.Popen` chained stdout to stdin,
+    looks like a single Popen to `Proc`
+
+    returncode follows `set -o pipefail`:
+    the last non-zero return code of stages, or 0 if all of them succeed
+    """
+
+    def __init__(self, procs, stderr):
+        self.procs = procs
+        self.args = [proc.args for proc in procs]
+        self.stdin = procs[0].stdin
+        self.stdout = procs[-1].stdout
+        self.stderr = stderr
+
+    @property
+    def returncodes(self):
+        return [proc.returncode for proc in self.procs]
+
+    @property
+    def returncode(self):
+        return_codes = self.returncodes
+        if None in return_codes:
+            return None
+        for return_code in reversed(return_codes):
+            if return_code:
+                return return_code
+        return 0
+
+    def poll(self):
+        for proc in self.procs:
+            proc.poll()
+        return self.returncode
+
+    def wait(self):
+        for proc in self.procs:
+            proc.wait()
+        return self.returncode
+
+    def kill(self):
+        for proc in self.procs:
+            if proc.returncode is None:
+                proc.kill()
+
+
+class Pipeline(Proc):
+    """
+    run commands like `a | b | c`, stages are connected by os pipes,
+    data between stages never goes through python
+
+    stdout comes from the last stage, stderr is shared by all stages
+
+    Usage::
+
+        >>> p = Pipeline([["ls"], ["grep", "py"]], "/", {}, timeout=1)
+        >>> p.block()
+        >>> p.return_codes
+        [0, 0]
+
+    """
+
+    def __init__(
+        self, stages, cwd, env, timeout, capture=True, input=None,
+        spill_threshold=None, keep_tail=None, keep_tail_lines=None
+    ):
+        """
+        :param stages: list of commands, each one in args list format
+        the rest are the same as `Proc`
+        """
+        cmd = []
+        for stage in stages:
+            cmd.extend(["|"] + stage if cmd else stage)
+        super(Pipeline, self).__init__(
+            cmd, cwd, env, timeout, capture, input,
+            spill_threshold, keep_tail, keep_tail_lines
+        )
+        self._stages = stages
+        self._return_codes = None
+
+    @property
+    def stages(self):
+        """commands of each stage."""
+        return [stage[:] for stage in self._stages]
+
+    @property
+    def return_codes(self):
+        """return code of each stage"""
+        return self._return_codes
+
+    def _spawn(self):
+        procs = []
+        stdin = None if self._input is None else subprocess.PIPE
+        err_read, err_write = os.pipe()
+        try:
+            for stage in self._stages:
+                proc = subprocess.Popen(
+                    stage,
+                    stdin=stdin,
+                    stdout=subprocess.PIPE,
+                    stderr=err_write,
+                    **spawn_options(stage, self.cwd, self.env, self.close_fds)
+                )
+                if procs:
+                    stdin.close()
+                stdin = proc.stdout
+                procs.append(proc)
+        except Exception:
+            os.close(err_read)
+            for proc in procs:
+                proc.kill()
+            raise
+        finally:
+            os.close(err_write)
+        return PipelineProcess(procs, open(err_read, "rb"))
+
+    def _finish(self, proc, buffers):
+        super(Pipeline, self)._finish(proc, buffers)
+        self._return_codes = proc.returncodes
+
+    def _can_communicate(self):
+        return False
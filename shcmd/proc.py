@@ -2,19 +2,75 @@
 
 import contextlib
 import functools
-import io
 import logging
+import os
+import selectors
+import shutil
 import subprocess
-import threading
 import time
 
+from .buffers import ChunkBuffer, NullBuffer, SpillBuffer, TailBuffer
 from .errors import ShCmdError
+from .scheduler import scheduler
+from .utils import LineSplitter
 
 
 logger = logging.getLogger(__name__)
 
-LINE_CHUNK_SIZE = 1024
+CONTENT_CHUNK_SIZE = 64 * 1024
+LINE_CHUNK_SIZE = CONTENT_CHUNK_SIZE
 FINISHED = "finished"
+STDOUT = "stdout"
+STDERR = "stderr"
+# bytes of spilled output to log when the command fails
+ERROR_LOG_TAIL = 64 * 1024
+
+
+_executables = {}
+
+
+def spawn_options(cmd, cwd, env, close_fds=False):
+    """
+    keyword args for `subprocess.Popen` that let it take the cheapest path
+
+    subprocess spawns with `os.posix_spawn` only when the executable is a
+    path, fds are not closed and cwd is not changed; otherwise it still
+    prefers vfork over fork. fds created by python are not inheritable,
+    so `close_fds=False` leaks nothing unless made inheritable on purpose.
+
+    cwd is passed on as given, it is only None when the caller did not
+    ask for one, so the child starts in the current dir at spawn time
+
+    :param cmd: args list
+    :param cwd: the command's working dir, None for the current dir
+    :param env: the environment variable
+    :param close_fds: close inheritable fds in child, disables posix_spawn
+    """
+    options = dict(cwd=cwd, env=env, close_fds=close_fds)
+
+    path = os.pathsep.join(os.get_exec_path(env))
+    key = (cmd[0], path)
+    executable = _executables.get(key)
+    if executable is None or not os.access(executable, os.X_OK):
+        # not resolved yet, or removed since then
+        executable = shutil.which(cmd[0], path=path)
+        if executable is None or not os.path.isabs(executable):
+            _executables.pop(key, None)
+            return options
+        _executables[key] = executable
+    options["executable"] = executable
+    return options
+
+
+def _loggable(data):
+    """output as text for logging, only the tail of spilled output"""
+    if isinstance(data, bytes):
+        return str(data, "utf8", "replace")
+    skipped = max(0, len(data) - ERROR_LOG_TAIL)
+    text = str(data[skipped:], "utf8", "replace")
+    if skipped:
+        text = "...({0} bytes skipped){1}".format(skipped, text)
+    return text
 
 
 def kill_proc(proc, cmd, started_at):
@@ -38,17 +94,36 @@ class Proc(object):
     """
     Simple Wrapper around the built-in subprocess module
 
-    use threading.Timer to add timeout option
+    timeouts are served by the process-wide `scheduler`
     easy interface for get streamed output of stdout
     """
     codec = "utf8"
+    # set to True to close inheritable fds in children, costs posix_spawn
+    close_fds = False
 
-    def __init__(self, cmd, cwd, env, timeout):
+    def __init__(
+        self, cmd, cwd, env, timeout, capture=True, input=None,
+        spill_threshold=None, keep_tail=None, keep_tail_lines=None
+    ):
         """
         :param cmd: the command
-        :param cwd: the command should be running under `cwd` dir
+        :param cwd: the command should be running under `cwd` dir,
+            None to run in the current dir
         :param env: the environment variable
         :param timeout: the command should return in `timeout` seconds
+        :param capture: keep stdout in memory (default True),
+            set to False when the output is only consumed while streaming
+        :param input: data to feed into stdin: bytes, str, a file object
+            or an iterator of chunks, it's written while reading the output
+        :param spill_threshold: (optional) max bytes of each output kept in
+            memory, the rest goes into a temporary file and `content` is
+            served from a read-only mmap of it
+        :param keep_tail: (optional) only keep the last `keep_tail` bytes
+            of each output, everything is still streamed; the tail may
+            start in the middle of a multibyte char, `stdout` then raises
+            `UnicodeDecodeError`, `content` is always safe
+        :param keep_tail_lines: (optional) only keep the last lines
+            of each output, can be combined with `keep_tail`
 
         Usage::
 
@@ -64,8 +139,15 @@ class Proc(object):
         self._cwd = cwd
         self._env = env
         self._timeout = timeout
+        self._capture = capture
+        self._input = input
+        self._spill_threshold = spill_threshold
+        self._keep_tail = keep_tail
+        self._keep_tail_lines = keep_tail_lines
         self._state = "not executed"
         self._return_code = self._stdout = self._stderr = None
+        self._popen = None
+        self._killed = False
 
     @property
     def finished(self):
@@ -95,6 +177,11 @@ class Proc(object):
         """the proc's timeout setting."""
         return self._timeout
 
+    @property
+    def capture(self):
+        """`True` if the proc keeps its stdout."""
+        return self._capture
+
     @property
     def data(self):
         return self._stdout
@@ -102,13 +189,13 @@ class Proc(object):
     @output
     def stdout(self):
         """proc's stdout."""
-        return self._stdout.decode(self.codec)
+        return str(self._stdout, self.codec)
 
     @output
     def stderr(self):
         """proc's stderr."""
         self.raise_for_error()
-        return self._stderr.decode(self.codec)
+        return str(self._stderr, self.codec)
 
     @property
     def return_code(self):
@@ -117,7 +204,9 @@ class Proc(object):
 
     @output
     def content(self):
-        """the output gathered in stdout in bytes format"""
+        """the output gathered in stdout in bytes format
+        (a read-only mmap if it's spilled to disk)
+        """
         return self._stdout
 
     @property
@@ -140,13 +229,23 @@ class Proc(object):
         if self.ok:
             return self
         tip = "running {0} @<{1}> error, return code {2}".format(
-            " ".join(self.cmd), self.cwd, self.return_code
+            " ".join(self.cmd), self.cwd or os.getcwd(), self.return_code
         )
         logger.error("{0}\nstdout:{1}\nstderr:{2}\n".format(
-            tip, self._stdout.decode("utf8"), self._stderr.decode("utf8")
+            tip, _loggable(self._stdout), _loggable(self._stderr)
         ))
         raise ShCmdError(self)
 
+    def _spawn(self):
+        """start the command, stdout and stderr are pipes"""
+        return subprocess.Popen(
+            self.cmd,
+            stdin=None if self._input is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **spawn_options(self.cmd, self.cwd, self.env, self.close_fds)
+        )
+
     @contextlib.contextmanager
     def _stream(self):
         """execute subprocess with timeout
@@ -161,92 +260,217 @@ class Proc(object):
         """
         timer = None
         try:
-            proc = subprocess.Popen(
-                self.cmd, cwd=self.cwd, env=self.env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            timer = threading.Timer(
-                self.timeout,
-                kill_proc, [proc, self.cmd, time.time()]
-            )
-            timer.start()
+            proc = self._track(self._spawn())
+            if self.timeout is not None:
+                timer = scheduler.schedule(
+                    self.timeout, kill_proc, proc, self.cmd, time.time()
+                )
             yield proc
         finally:
+            self._popen = None
             if timer is not None:
-                timer.cancel()
-
-    def iter_lines(self, warn_only=False):
-        """yields stdout text, line by line."""
-        remain = ""
-        for data in self.iter_content(LINE_CHUNK_SIZE, warn_only=True):
-            line_break_found = data[-1] in (b"\n", b"\r")
-            lines = data.decode(self.codec).splitlines()
-            lines[0] = remain + lines[0]
-            if not line_break_found:
-                remain = lines.pop()
-            for line in lines:
+                scheduler.cancel(timer)
+
+    def _track(self, proc):
+        """remember the running proc, so `_kill` can reach it"""
+        self._popen = proc
+        if self._killed:
+            kill_proc(proc, self.cmd, time.time())
+        return proc
+
+    def _kill(self):
+        """kill the command from another thread, if it is running,
+        or as soon as it is spawned
+        """
+        self._killed = True
+        proc = self._popen
+        if proc is not None:
+            kill_proc(proc, self.cmd, time.time())
+
+    def iter_lines(
+        self, warn_only=False, chunk_size=LINE_CHUNK_SIZE, decode_unicode=True
+    ):
+        """
+        yields stdout text, line by line, split on \\n, \\r\\n or \\r only
+
+        :param chunk_size: max size of each read (in bytes)
+        :param decode_unicode: default True, set to False to get bytes lines
+        """
+        splitter = LineSplitter(self.codec if decode_unicode else None)
+        for data in self.iter_content(chunk_size, warn_only=True):
+            for line in splitter.feed(data):
                 yield line
-        if remain:
-            yield remain
+        for line in splitter.flush():
+            yield line
 
         self._state = FINISHED
         if not warn_only:
             self.raise_for_error()
 
-    def iter_content(self, chunk_size=1, warn_only=False):
+    @property
+    def _keeps_tail(self):
+        return self._keep_tail is not None or self._keep_tail_lines is not None
+
+    def _new_buffer(self):
+        if self._keeps_tail:
+            return TailBuffer(self._keep_tail, self._keep_tail_lines)
+        if self._spill_threshold is not None:
+            return SpillBuffer(self._spill_threshold)
+        return ChunkBuffer()
+
+    def _new_buffers(self):
+        """buffers to collect the output of a run, keyed by stream name"""
+        return {
+            STDOUT: self._new_buffer() if self.capture else NullBuffer(),
+            STDERR: self._new_buffer()
+        }
+
+    def _finish(self, proc, buffers):
+        self._return_code = proc.returncode
+        self._stdout = buffers[STDOUT].getvalue()
+        self._stderr = buffers[STDERR].getvalue()
+
+    def _replay(self, chunk_size):
+        """yields (stream, chunk) from a finished proc"""
+        outputs = ((STDOUT, self._stdout), (STDERR, self._stderr))
+        for stream, data in outputs:
+            for offset in range(0, len(data), chunk_size):
+                yield stream, data[offset:offset + chunk_size]
+
+    def _iter_input(self, chunk_size):
+        """yields non-empty chunks of input in bytes format"""
+        data = self._input
+        if hasattr(data, "read"):
+            chunks = iter(lambda: data.read(chunk_size) or None, None)
+        elif isinstance(data, (str, bytes, bytearray, memoryview)):
+            chunks = [data]
+        else:
+            chunks = data
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(self.codec)
+            if chunk:
+                yield chunk
+
+    def _read_output(self, proc, chunk_size):
+        """yields (stream, chunk) from proc's stdout and stderr,
+        and feeds proc's stdin with the input meanwhile
+
+        only wakes up when one of the pipes is ready,
+        each chunk is at most `chunk_size` bytes
         """
-        yields stdout data, chunk by chunk
+        with selectors.DefaultSelector() as selector:
+            selector.register(proc.stdout, selectors.EVENT_READ, STDOUT)
+            selector.register(proc.stderr, selectors.EVENT_READ, STDERR)
+            if proc.stdin is not None:
+                os.set_blocking(proc.stdin.fileno(), False)
+                selector.register(proc.stdin, selectors.EVENT_WRITE)
+                chunks = self._iter_input(chunk_size)
+                pending = memoryview(b"")
+            while selector.get_map():
+                for key, __ in selector.select():
+                    if key.fileobj is not proc.stdin:
+                        chunk = os.read(key.fd, chunk_size)
+                        if chunk:
+                            yield key.data, chunk
+                        else:
+                            selector.unregister(key.fileobj)
+                        continue
+
+                    if not pending:
+                        pending = memoryview(next(chunks, b""))
+                    try:
+                        if pending:
+                            pending = pending[os.write(key.fd, pending):]
+                            continue
+                    except BlockingIOError:
+                        continue
+                    except BrokenPipeError:
+                        pass
+                    # input exhausted or the command stops reading it
+                    selector.unregister(proc.stdin)
+                    proc.stdin.close()
+
+    def iter_output(self, chunk_size=CONTENT_CHUNK_SIZE, warn_only=False):
+        """
+        yields (stream, chunk) tuples as the data arrives,
+        stream is either "stdout" or "stderr".
+        both pipes are drained together so a chatty stderr never stalls
+
+        a finished proc replays its stdout, then its stderr
+
+        :param chunk_size: max size of each chunk (in bytes)
+
+        Usage::
+
+            >>> proc = shcmd.run("make", stream=True)
+            >>> for stream, chunk in proc.iter_output():
+            ...     print(stream, chunk)
+            ...
 
-        :param chunk_size: size of each chunk (in bytes)
         """
         self._state = "not finished"
         if self.return_code is not None:
-            stdout = io.BytesIO(self._stdout)
-            data = stdout.read(chunk_size)
-            while data:
-                yield data
-                data = stdout.read(chunk_size)
+            for stream, chunk in self._replay(chunk_size):
+                yield stream, chunk
         else:
-            data = b''
+            buffers = self._new_buffers()
             started_at = time.time()
             with self._stream() as proc:
-                while proc.poll() is None:
-                    chunk = proc.stdout.read(chunk_size)
-                    if not chunk:
-                        continue
-                    yield chunk
-                    data += chunk
+                for stream, chunk in self._read_output(proc, chunk_size):
+                    yield stream, chunk
+                    buffers[stream].write(chunk)
 
+                proc.wait()
                 if proc.returncode == -9:
                     elapsed = time.time() - started_at
+                    self._stdout = buffers[STDOUT].getvalue()
+                    self._stderr = buffers[STDERR].getvalue()
                     self._state = "timeouted"
                     raise subprocess.TimeoutExpired(proc.args, elapsed)
 
-                chunk = proc.stdout.read(chunk_size)
-                while chunk:
-                    yield chunk
-                    data += chunk
-                    chunk = proc.stdout.read(chunk_size)
+            self._finish(proc, buffers)
 
-            self._return_code = proc.returncode
-            self._stderr = proc.stderr.read()
-            self._stdout = data
+        self._state = FINISHED
+        if not warn_only:
+            self.raise_for_error()
+
+    def iter_content(self, chunk_size=CONTENT_CHUNK_SIZE, warn_only=False):
+        """
+        yields stdout data, chunk by chunk
+
+        :param chunk_size: max size of each chunk (in bytes)
+        """
+        for stream, chunk in self.iter_output(chunk_size, warn_only):
+            if stream == STDOUT:
+                yield chunk
 
-            self._state = FINISHED
-            if not warn_only:
-                self.raise_for_error()
+    def _can_communicate(self):
+        """`True` if `block` can simply use `Popen.communicate`"""
+        bounded = self._spill_threshold is not None or self._keeps_tail
+        if not self.capture or bounded:
+            return False
+        return self._input is None or isinstance(self._input, bytes)
 
     def block(self, warn_only=False):
         """blocked executation."""
         self._state = "not finished"
-        if self._return_code is None:
-            proc = subprocess.Popen(
-                self.cmd, cwd=self.cwd, env=self.env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            self._stdout, self._stderr = proc.communicate(timeout=self.timeout)
+        if self._return_code is None and not self._can_communicate():
+            for __ in self.iter_output(warn_only=True):
+                pass
+        elif self._return_code is None:
+            proc = self._track(self._spawn())
+            try:
+                self._stdout, self._stderr = proc.communicate(
+                    input=self._input, timeout=self.timeout
+                )
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                self._stdout, self._stderr = proc.communicate()
+                self._state = "timeouted"
+                raise
+            finally:
+                self._popen = None
             self._return_code = proc.returncode
 
         self._state = FINISHED
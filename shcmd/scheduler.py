@@ -0,0 +1,94 @@
+# -*- coding: utf8 -*-
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler(object):
+    """
+    call functions when their deadlines come,
+    one thread serves every scheduled call of the process
+
+    Usage::
+
+        >>> handle = scheduler.schedule(1, print, "time's up")
+        >>> scheduler.cancel(handle)
+
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._counter = itertools.count()
+        self._cancelled = 0
+        self._thread = None
+
+    def __len__(self):
+        """number of calls still waiting"""
+        with self._cond:
+            return len(self._heap) - self._cancelled
+
+    def schedule(self, delay, func, *args):
+        """call `func(*args)` after `delay` seconds
+        returns a handle for `cancel`
+        """
+        entry = [time.monotonic() + delay, next(self._counter), func, args]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="shcmd-scheduler", daemon=True
+                )
+                self._thread.start()
+            elif self._heap[0] is entry:
+                self._cond.notify()
+        return entry
+
+    def cancel(self, entry):
+        """cancel a scheduled call, no-op if it has been called"""
+        with self._cond:
+            if entry[2] is None:
+                return
+            entry[2] = None
+            self._cancelled += 1
+            # drop cancelled entries once they dominate the heap
+            if self._cancelled > len(self._heap) // 2:
+                self._heap = [e for e in self._heap if e[2] is not None]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def _next_due(self):
+        """blocks until an entry is due, pops and returns it"""
+        with self._cond:
+            while True:
+                while self._heap and self._heap[0][2] is None:
+                    heapq.heappop(self._heap)
+                    self._cancelled -= 1
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                wait = self._heap[0][0] - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                entry = heapq.heappop(self._heap)
+                func, args = entry[2], entry[3]
+                entry[2] = None
+                return func, args
+
+    def _run(self):
+        while True:
+            func, args = self._next_due()
+            try:
+                func(*args)
+            except Exception:
+                logger.exception("scheduled call {0} failed".format(func))
+
+
+scheduler = Scheduler()
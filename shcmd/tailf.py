@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import codecs
+import contextlib
+import glob
 import logging
 import os
 import time
@@ -8,24 +11,224 @@ import types
 from collections import deque
 
 from . import consts
+from .checkpoint import Checkpoint
 from .errors import ShCmdError
+from .watch import new_waiter
 
 logger = logging.getLogger(__name__)
 
 
+MAX_LINES_PER_ROUND = 1000
+LASTN_BLOCK_SIZE = 64 * 1024
+BATCH_SIZE = 1024 * 1024
+BATCH_LATENCY = 0.1
+
+
 def always_false(___):
     return False
 
 
+def lastn_offset(file_obj, lastn, block_size=LASTN_BLOCK_SIZE):
+    """find where the last `lastn` lines start by reading backwards,
+    returns the byte offset
+
+    :param file_obj: file opened in binary mode
+    :param lastn: number of lines
+    :param block_size: bytes to read each time
+    """
+    end = pos = file_obj.seek(0, os.SEEK_END)
+    if lastn <= 0:
+        return end
+    newlines = 0
+    while pos > 0:
+        start = max(0, pos - block_size)
+        file_obj.seek(start)
+        block = file_obj.read(pos - start)
+        # the line break of the last line does not start a new line
+        if pos == end and block.endswith(b"\n"):
+            block = block[:-1]
+        index = len(block)
+        while True:
+            index = block.rfind(b"\n", 0, index)
+            if index < 0:
+                break
+            newlines += 1
+            if newlines == lastn:
+                return start + index + 1
+        pos = start
+    return 0
+
+
+class Follower(object):
+    """
+    the state of following one file by name, like `tail -F`
+
+    the followed file's device and inode are tracked, when another file
+    takes its name (logrotate), the rest of the old file is drained
+    before switching to the new one
+
+    :param filepath: file to follow
+    :param encoding: encoding of the file, None to read it in bytes
+    :param offset: (optional) byte offset to start reading at
+    :param waiter: (optional) waiter to watch every opened file with
+    """
+
+    def __init__(self, filepath, encoding, offset=None, waiter=None):
+        self.path = filepath
+        self._encoding = encoding
+        self._waiter = waiter
+        self._open()
+        # line breaks can only be found in bytes with ascii compatible codecs
+        self._seekable = encoding is None or "\n".encode(encoding) == b"\n"
+        if offset is not None:
+            self.seek(offset)
+
+    def _open(self):
+        if self._encoding is None:
+            file_obj = open(self.path, "rb")
+        else:
+            file_obj = open(self.path, "rt", encoding=self._encoding)
+        stat = os.fstat(file_obj.fileno())
+        self._file = file_obj
+        self._inode = (stat.st_dev, stat.st_ino)
+        if self._waiter is not None:
+            self._waiter.watch(self.path)
+
+    @property
+    def inode(self):
+        """(device, inode) of the file being read"""
+        return self._inode
+
+    @property
+    def offset(self):
+        """byte offset of the next line in the file being read"""
+        return self._file.tell()
+
+    def seek(self, offset):
+        """continue at byte `offset`, from the beginning if the file
+        is shorter than that
+        """
+        if offset > os.fstat(self._file.fileno()).st_size:
+            logger.info("file [{0}] shorter than {1}, rewinded!".format(
+                self.path, offset
+            ))
+            offset = 0
+        self._file.seek(offset)
+
+    def seek_lastn(self, lastn):
+        """move to where the last `lastn` lines start"""
+        raw = getattr(self._file, "buffer", self._file)
+        self._file.seek(lastn_offset(raw, lastn))
+
+    def lastn(self, lastn):
+        """returns the last `lastn` lines, leaves the file at its end
+
+        only the tail of the file is read, unless the codec is not
+        ascii compatible
+        """
+        lastn_filter = deque(maxlen=lastn)
+        logger.debug("tail last {0} lines".format(lastn))
+        if self._seekable:
+            self.seek_lastn(lastn)
+        for line in self._file:
+            lastn_filter.append(line.rstrip())
+        return list(lastn_filter)
+
+    def readline(self):
+        """returns the next line, empty if there's no data for now"""
+        return self._read(lambda: self._file.readline())
+
+    def read(self, size):
+        """returns at most `size` of data, empty if there's no data for now"""
+        return self._read(lambda: self._file.read(size))
+
+    def _read(self, read):
+        data = read()
+        if data:
+            return data
+        where = self._file.tell()
+        self._file.seek(0, os.SEEK_END)
+        if self._file.tell() < where:
+            logger.info("file [{0}] rewinded!".format(self.path))
+            self._file.seek(0)
+            return read()
+        if not self._replaced():
+            return data
+
+        # the writer may still append to the old file before reopening
+        data = read()
+        if data:
+            return data
+        old_file = self._file
+        try:
+            self._open()
+        except FileNotFoundError:
+            return data
+        old_file.close()
+        logger.info("file [{0}] rotated!".format(self.path))
+        return read()
+
+    def _replaced(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (stat.st_dev, stat.st_ino) != self._inode
+
+    def close(self):
+        self._file.close()
+
+
+def _resume(follower, checkpoint):
+    """seek to the saved offset, returns False if nothing saved"""
+    saved = checkpoint.get(follower.path)
+    if saved is None:
+        return False
+    inode, offset = saved
+    if inode != follower.inode:
+        # replaced while nobody was following, all of it is new
+        logger.info("file [{0}] rotated!".format(follower.path))
+        offset = 0
+    follower.seek(offset)
+    return True
+
+
+def _save(followers, checkpoint):
+    for follower in followers:
+        checkpoint.update(follower.path, follower.inode, follower.offset)
+    checkpoint.flush()
+
+
+def _check_args(timeout, delay, stopon):
+    if consts.TIMEOUT_MAX > timeout:
+        timeout = consts.TIMEOUT_DEFAULT
+
+    delay = delay if consts.DELAY_MAX > delay > 0 else consts.DELAY_DEFAULT
+    if isinstance(stopon, types.FunctionType) is False:
+        stopon = always_false
+    return timeout, delay, stopon
+
+
+def _wait(waiter, timeout, start, delay=None):
+    """wait for changes until timeout, no longer than `delay` if given"""
+    wait = None if timeout < 0 else timeout - (time.time() - start)
+    if delay is not None:
+        wait = delay if wait is None else min(wait, delay)
+    return waiter.wait(wait)
+
+
 def tailf(
     filepath,
     lastn=0,
     timeout=60,
     stopon=None,
     encoding="utf8",
-    delay=0.1
+    delay=0.1,
+    inotify=True,
+    offset=None,
+    checkpoint=None
 ):
-    """provide a `tail -f` like function
+    """provide a `tail -F` like function, follows the file by name
 
     :param filepath: file to tail -f, absolute path or relative path
     :param lastn: lastn line will also be yield
@@ -34,6 +237,14 @@ def tailf(
     :param stopon: (optional) stops when the stopon(output) returns True
     :param encoding: (optional) default encoding utf8
     :param delay: (optional) sleep if no data is available, default is 0.1s
+    :param inotify: (optional) default True, wait for changes with inotify
+        when available, set to False to always sleep `delay` seconds;
+        writes inotify misses on network filesystems are still seen
+        within `watch.RESCAN_INTERVAL` seconds
+    :param offset: (optional) resume at this byte offset instead of the end,
+        lastn is ignored then
+    :param checkpoint: (optional) `Checkpoint` or path of its file,
+        resume at the saved offset and keep it updated while following
 
     Usage::
         >>> for line in tailf('/tmp/foo'):
@@ -45,40 +256,254 @@ def tailf(
     if not os.path.isfile(filepath):
         raise ShCmdError("[{0}] not exists".format(filepath))
 
-    if consts.TIMEOUT_MAX > timeout:
-        timeout = consts.TIMEOUT_DEFAULT
-
-    delay = delay if consts.DELAY_MAX > delay > 0 else consts.DELAY_DEFAULT
-    if isinstance(stopon, types.FunctionType) is False:
-        stopon = always_false
+    timeout, delay, stopon = _check_args(timeout, delay, stopon)
 
     logger.info("tail -f {0} begin".format(filepath))
 
-    with open(filepath, "rt", encoding=encoding) as file_obj:
-        lastn_filter = deque(maxlen=lastn)
-        logger.debug("tail last {0} lines".format(lastn))
+    if isinstance(checkpoint, str):
+        checkpoint = Checkpoint(checkpoint)
 
-        for line in file_obj:
-            lastn_filter.append(line.rstrip())
-        for line in lastn_filter:
-            yield line
+    waiter = new_waiter(delay, inotify)
+    with contextlib.closing(waiter), contextlib.closing(
+        Follower(filepath, encoding, offset, waiter)
+    ) as follower:
+        resumed = offset is not None or (
+            checkpoint is not None and _resume(follower, checkpoint)
+        )
+        if not resumed:
+            for line in follower.lastn(lastn):
+                yield line
+
+        debug = logger.isEnabledFor(logging.DEBUG)
+        try:
+            start = time.time()
+            while timeout < 0 or (time.time() - start) < timeout:
+                line = follower.readline()
+                if line:
+                    if debug:
+                        logger.debug("found line: [{0}]".format(line))
+                    yield line
+                    if checkpoint is not None and checkpoint.due:
+                        _save([follower], checkpoint)
+                    if stopon(line):
+                        break
+                else:
+                    if checkpoint is not None and checkpoint.due:
+                        _save([follower], checkpoint)
+                    _wait(waiter, timeout, start)
+        finally:
+            if checkpoint is not None:
+                _save([follower], checkpoint)
+
+    logger.info("tail -f {0} end".format(filepath))
+
+
+def _split_lines(text):
+    """split text ending with a line break into lines, keeping the breaks"""
+    lines = text.split("\n")
+    lines.pop()
+    return [line + "\n" for line in lines]
+
+
+def tailf_batches(
+    filepath,
+    lastn=0,
+    timeout=60,
+    stopon=None,
+    encoding="utf8",
+    delay=0.1,
+    inotify=True,
+    batch_size=BATCH_SIZE,
+    max_latency=BATCH_LATENCY
+):
+    """like `tailf`, but reads the file in large binary blocks and yields
+    batches of complete lines instead of one line at a time
+
+    lines are only split on b"\n", a partial line at the end of the file
+    is held back until its line break is written
+
+    :param encoding: (optional) default utf8, each batch is a list of lines
+        decoded with it, None to yield the raw bytes of the lines instead
+    :param batch_size: (optional) a batch is yielded once it has this many
+        bytes, default 1MB
+    :param max_latency: (optional) max seconds a line waits for its batch
+        to fill up, default 0.1s
+    :param stopon: (optional) stops when the stopon(batch) returns True
+    the rest are the same as `tailf`
+
+    Usage::
+        >>> for lines in tailf_batches('/tmp/foo', max_latency=1):
+        ...     print(len(lines))
+        ...
+        1024
+        17
+    """
+    if not os.path.isfile(filepath):
+        raise ShCmdError("[{0}] not exists".format(filepath))
+
+    timeout, delay, stopon = _check_args(timeout, delay, stopon)
+    if encoding is not None:
+        decoder = codecs.getincrementaldecoder(encoding)()
+    block_size = max(1, min(batch_size, LASTN_BLOCK_SIZE))
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    logger.info("tail -f {0} begin".format(filepath))
 
+    waiter = new_waiter(delay, inotify)
+    with contextlib.closing(waiter), contextlib.closing(
+        Follower(filepath, None, waiter=waiter)
+    ) as follower:
+        follower.seek_lastn(lastn)
+        partial = []
+        batch = []
+        batch_bytes = 0
+        first_at = None
         start = time.time()
         while timeout < 0 or (time.time() - start) < timeout:
-            line = file_obj.readline()
-            where = file_obj.tell()
-            if line:
-                logger.debug("found line: [{0}]".format(line))
-                yield line
-                if stopon(line):
+            data = follower.read(block_size)
+            end = data.rfind(b"\n") + 1
+            if end:
+                partial.append(data[:end])
+                batch.append(b"".join(partial))
+                partial = [data[end:]]
+                batch_bytes += len(batch[-1])
+                if first_at is None:
+                    first_at = time.time()
+            elif data:
+                partial.append(data)
+
+            waited = 0 if first_at is None else time.time() - first_at
+            if batch and (batch_bytes >= batch_size or waited >= max_latency):
+                chunk = b"".join(batch)
+                batch = []
+                batch_bytes = 0
+                first_at = None
+                if encoding is not None:
+                    chunk = _split_lines(decoder.decode(chunk))
+                if debug:
+                    logger.debug("found batch: [{0}]".format(chunk))
+                yield chunk
+                if stopon(chunk):
                     break
-            else:
-                file_obj.seek(0, os.SEEK_END)
-                if file_obj.tell() < where:
-                    logger.info("file [{0}] rewinded!".format(filepath))
-                    file_obj.seek(0)
-                else:
-                    logger.debug("no data, waiting for [{0}]s".format(delay))
-                    time.sleep(delay)
+            elif not data:
+                _wait(
+                    waiter, timeout, start,
+                    max_latency - waited if batch else None
+                )
+        if batch:
+            # time's up, lines already read are not dropped
+            chunk = b"".join(batch)
+            if encoding is not None:
+                chunk = _split_lines(decoder.decode(chunk))
+            yield chunk
 
     logger.info("tail -f {0} end".format(filepath))
+
+
+def tailf_many(
+    patterns,
+    lastn=0,
+    timeout=60,
+    stopon=None,
+    encoding="utf8",
+    delay=0.1,
+    inotify=True,
+    checkpoint=None
+):
+    """follow many files in one loop, yields (filepath, line)
+
+    files matching the patterns later are followed from their beginning
+
+    :param patterns: file paths or glob patterns, a single str is also ok
+    :param checkpoint: (optional) `Checkpoint` or path of its file,
+        files saved in it are resumed at their offsets
+    the rest are the same as `tailf`, `stopon` stops following all files
+
+    Usage::
+        >>> for path, line in tailf_many(["/var/log/*.log"]):
+        ...     print(path, line)
+        ...
+        "/var/log/foo.log" "bar"
+        "/var/log/baz.log" "barz"
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    if isinstance(checkpoint, str):
+        checkpoint = Checkpoint(checkpoint)
+    timeout, delay, stopon = _check_args(timeout, delay, stopon)
+    # new dirs matching a magic dirname can not be watched, poll for them
+    max_wait = None
+    if any(glob.has_magic(os.path.dirname(p)) for p in patterns):
+        max_wait = delay
+
+    logger.info("tail -f {0} begin".format(patterns))
+
+    waiter = new_waiter(delay, inotify)
+    followers = {}
+
+    def scan():
+        found = []
+        for pattern in patterns:
+            if not glob.has_magic(os.path.dirname(pattern)):
+                waiter.watch_dir(os.path.dirname(os.path.abspath(pattern)))
+            for filepath in glob.glob(pattern):
+                filepath = os.path.abspath(filepath)
+                if filepath in followers or not os.path.isfile(filepath):
+                    continue
+                try:
+                    followers[filepath] = Follower(
+                        filepath, encoding, waiter=waiter
+                    )
+                except OSError as e:
+                    logger.info("can not follow {0}: {1}".format(filepath, e))
+                    continue
+                if checkpoint is not None:
+                    _resume(followers[filepath], checkpoint)
+                found.append(followers[filepath])
+        return found
+
+    try:
+        for follower in scan():
+            if checkpoint is None or checkpoint.get(follower.path) is None:
+                for line in follower.lastn(lastn):
+                    yield follower.path, line
+
+        debug = logger.isEnabledFor(logging.DEBUG)
+        start = time.time()
+        changed = None
+        while timeout < 0 or (time.time() - start) < timeout:
+            if changed is None or changed.difference(followers):
+                scan()
+            busy = set()
+            for follower in list(followers.values()):
+                if changed is not None and follower.path not in changed:
+                    continue
+                for __ in range(MAX_LINES_PER_ROUND):
+                    line = follower.readline()
+                    if not line:
+                        break
+                    if debug:
+                        logger.debug("found line: [{0}]".format(line))
+                    yield follower.path, line
+                    if checkpoint is not None and checkpoint.due:
+                        _save(followers.values(), checkpoint)
+                    if stopon(line):
+                        return
+                else:
+                    busy.add(follower.path)
+            if busy:
+                # give the others a chance before going on with busy files
+                changed = waiter.wait(0)
+                if changed is not None:
+                    changed.update(busy)
+            else:
+                if checkpoint is not None and checkpoint.due:
+                    _save(followers.values(), checkpoint)
+                changed = _wait(waiter, timeout, start, max_wait)
+    finally:
+        if checkpoint is not None:
+            _save(followers.values(), checkpoint)
+        for follower in followers.values():
+            follower.close()
+        waiter.close()
+        logger.info("tail -f {0} end".format(patterns))
@@ -1,6 +1,125 @@
+import bz2
+import collections
+import concurrent.futures
+import errno
 import io
+import lzma
 import os
+import queue
+import stat
 import tarfile
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .errors import ShCmdError
+from .manifest import Manifest
+
+CHUNK_SIZE = 64 * 1024
+COMPRESS_QUEUE_SIZE = 16
+COMPRESSIONS = ("gz", "bz2", "xz", "zst")
+PREFETCH_AHEAD = 4
+PREFETCH_BYTES = 64 * 1024 * 1024
+
+_STOP = object()
+
+# errnos meaning the kernel can not copy between these two fds
+_NO_KERNEL_COPY = frozenset([
+    errno.EINVAL, errno.ENOSYS, errno.EXDEV, errno.EOPNOTSUPP,
+    errno.ENOTSUP, errno.ENOTSOCK, errno.EBADF
+])
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+    return len(data)
+
+
+def _sendfile(in_fd, out_fd, offset, count):
+    return os.sendfile(out_fd, in_fd, offset, count)
+
+
+def _copy_file_range(in_fd, out_fd, offset, count):
+    return os.copy_file_range(in_fd, out_fd, count, offset)
+
+
+def _kernel_copy(copy, in_fd, out_fd, offset, count):
+    """returns bytes copied, less than count if copy is not supported"""
+    copied = 0
+    while copied < count:
+        try:
+            sent = copy(in_fd, out_fd, offset + copied, count - copied)
+        except OSError as e:
+            if e.errno in _NO_KERNEL_COPY:
+                break
+            raise
+        if not sent:
+            break
+        copied += sent
+    return copied
+
+
+def _send(fileobj, size, out_fd, to_file):
+    """copy `size` bytes from fileobj's position to out_fd,
+    the kernel does it if both ends support that
+    """
+    try:
+        in_fd = fileobj.fileno()
+    except (AttributeError, OSError):
+        in_fd = None
+
+    left = size
+    if in_fd is not None:
+        copies = [_sendfile]
+        if to_file and hasattr(os, "copy_file_range"):
+            copies.insert(0, _copy_file_range)
+        offset = fileobj.tell()
+        for copy in copies:
+            copied = _kernel_copy(copy, in_fd, out_fd, offset, left)
+            offset += copied
+            left -= copied
+            if not left:
+                break
+        fileobj.seek(offset)
+
+    while left:
+        data = fileobj.read(min(left, CHUNK_SIZE))
+        if not data:
+            raise OSError("unexpected end of data")
+        left -= _write_all(out_fd, data)
+    return size
+
+
+def new_compressor(compression, level=None):
+    """an incremental compressor, with `compress(data)` and `flush()`
+
+    :param compression: one of "gz", "bz2", "xz" or "zst",
+        "zst" needs the zstandard package
+    :param level: (optional) compression level, the codec's default if None
+    """
+    if compression == "gz":
+        if level is None:
+            level = zlib.Z_DEFAULT_COMPRESSION
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif compression == "bz2":
+        return bz2.BZ2Compressor(9 if level is None else level)
+    elif compression == "xz":
+        return lzma.LZMACompressor(preset=level)
+    elif compression == "zst":
+        if zstandard is None:
+            raise ShCmdError("zst compression needs zstandard installed")
+        if level is None:
+            level = 3
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise ShCmdError("unsupported compression [{0}], use one of {1}".format(
+        compression, COMPRESSIONS
+    ))
 
 
 class TarGenerator(object):
@@ -15,17 +134,73 @@ class TarGenerator(object):
         >>> tarfile = b"".join(data for data in tg.generate())
         >>> assert tarfile == tg.tar
 
+    with `stream=True` nothing is kept once yielded,
+    memory stays around `CHUNK_SIZE` however large the files are::
+
+        >>> tg = TarGenerator(stream=True)
+        >>> tg.files_to_add = ["/path/to/huge/dir"]
+        >>> for data in tg.generate():
+        ...     sock.sendall(data)
+        ...
+
+    with `compression` the tar is compressed on the fly,
+    like `tar.gz` generated with `tar czf`::
+
+        >>> tg = TarGenerator(compression="gz", compress_in_thread=True)
+
+    with `prefetch` threads, small files are read ahead in parallel,
+    the output is the same byte for byte::
+
+        >>> tg = TarGenerator(stream=True, prefetch=8)
+
+    with a `manifest`, only files added or changed since last time
+    go into the tar, names of removed ones are in `deleted`::
+
+        >>> tg = TarGenerator(manifest="/var/lib/builds/app.manifest")
+
     """
 
-    def __init__(self, origin=None):
+    def __init__(
+        self, origin=None, stream=False,
+        compression=None, compression_level=None, compress_in_thread=False,
+        prefetch=0, prefetch_bytes=PREFETCH_BYTES, manifest=None
+    ):
         """
-        :param origin: tar file to appending (default None, generate new tar)
+        :param origin: tar file to appending (default None, generate new tar),
+            bytes, path or file object of an uncompressed tar, its members
+            are copied as they are
+        :param stream: (optional) default False, drop the data once yielded
+        :param compression: (optional) "gz", "bz2", "xz" or "zst",
+            default None generates an uncompressed tar
+        :param compression_level: (optional) the codec's default if None
+        :param compress_in_thread: (optional) default False, compress in
+            a worker thread while files are being read
+        :param prefetch: (optional) default 0, number of threads that
+            stat and read upcoming files while earlier ones are written
+        :param prefetch_bytes: (optional) max bytes of file content read
+            ahead, 64MB by default
+        :param manifest: (optional) `Manifest` or path of its file,
+            files unchanged since it was saved are left out,
+            it is saved again once the tar is generated
         """
+        if compression is not None:
+            # fail early on unknown or unavailable codecs
+            new_compressor(compression, compression_level)
+        self._compression = compression
+        self._compression_level = compression_level
+        self._compress_in_thread = compress_in_thread
+        if isinstance(manifest, str):
+            manifest = Manifest(manifest)
+        self._manifest = manifest
+        self._prefetch = prefetch
+        self._prefetch_bytes = prefetch_bytes
+        self._stream = stream
         self._tar_buffer = io.BytesIO()
 
+        # only builds and encodes headers, data never goes through it
         self._tar_obj = tarfile.TarFile(
             mode="w",
-            fileobj=self._tar_buffer,
+            fileobj=io.BytesIO(),
             dereference=True
         )
 
@@ -33,12 +208,11 @@ class TarGenerator(object):
         self._files_to_add = set()
         self._ios_to_add = dict()
 
+        self._origin = None
         if origin:
             if isinstance(origin, bytes):
                 origin = io.BytesIO(origin)
-            origin_tar = tarfile.TarFile(fileobj=origin)
-            for info in origin_tar.getmembers():
-                self._tar_obj.addfile(info, origin_tar.extractfile(info))
+            self._origin = origin
 
     @property
     def files(self):
@@ -84,27 +258,292 @@ class TarGenerator(object):
 
             >>> tarfile = b"".join(data for data in tg.generate())
         """
-        if self._tar_buffer.tell():
-            self._tar_buffer.seek(0, 0)
-            yield self._tar_buffer.read()
+        if self._generated:
+            if self._stream:
+                raise ShCmdError("tar is streamed, nothing is kept")
+            yield self._tar_buffer.getvalue()
+            return
 
-        for fname in self._files_to_add:
-            last = self._tar_buffer.tell()
-            self._tar_obj.add(fname)
-            self._tar_buffer.seek(last, os.SEEK_SET)
-            data = self._tar_buffer.read()
+        blocks = self._iter_blocks()
+        if self._compression is not None:
+            compressor = new_compressor(
+                self._compression, self._compression_level
+            )
+            if self._compress_in_thread:
+                blocks = self._compress_in_worker(blocks, compressor)
+            else:
+                blocks = self._compress(blocks, compressor)
+
+        for data in blocks:
+            if not data:
+                continue
+            if not self._stream:
+                self._tar_buffer.write(data)
             yield data
+        self._generated = True
+
+    @staticmethod
+    def _compress(blocks, compressor):
+        for data in blocks:
+            yield compressor.compress(data)
+        yield compressor.flush()
+
+    @staticmethod
+    def _compress_in_worker(blocks, compressor):
+        """compress in a worker thread, while the caller reads files
+
+        the codecs release the GIL, so reading and compressing overlap,
+        at most `COMPRESS_QUEUE_SIZE` chunks wait to be compressed
+        """
+        todo = queue.Queue(COMPRESS_QUEUE_SIZE)
+        done = queue.Queue()
+
+        def worker():
+            try:
+                while True:
+                    data = todo.get()
+                    if data is _STOP:
+                        return
+                    elif data is None:
+                        done.put(compressor.flush())
+                        return
+                    done.put(compressor.compress(data))
+            except Exception as e:
+                done.put(e)
+                # keep the caller from blocking on a full queue
+                while todo.get() not in (None, _STOP):
+                    pass
+            finally:
+                done.put(_STOP)
+
+        def collect(block):
+            while True:
+                try:
+                    data = done.get(block)
+                except queue.Empty:
+                    return
+                if data is _STOP:
+                    return
+                elif isinstance(data, Exception):
+                    raise data
+                yield data
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        finished = False
+        try:
+            for data in blocks:
+                todo.put(data)
+                for compressed in collect(False):
+                    yield compressed
+            todo.put(None)
+            finished = True
+            for compressed in collect(True):
+                yield compressed
+        finally:
+            if not finished:
+                todo.put(_STOP)
+
+    def _iter_members(self):
+        """yields (tarinfo, fileobj or None) of every new member in order"""
+        if self._prefetch:
+            loaded = self._prefetch_files()
+        else:
+            loaded = (self._load(path, 0) for path in self._iter_paths())
+        for path, info, data in loaded:
+            if info is None:
+                # unchanged, or sockets, fifos and such
+                continue
+            elif data is not None:
+                yield info, io.BytesIO(data)
+            elif info.isreg():
+                with open(path, "rb") as f:
+                    yield info, f
+            else:
+                yield info, None
 
         for info, content in self._ios_to_add.items():
-            last = self._tar_buffer.tell()
-            self._tar_obj.addfile(info, content)
-            self._tar_buffer.seek(last, os.SEEK_SET)
-            data = self._tar_buffer.read()
-            yield data
+            yield info, content
+
+    def _iter_origin(self):
+        """(fileobj, size) of origin members, copied as they are"""
+        if isinstance(self._origin, str):
+            with open(self._origin, "rb") as f:
+                yield self._origin_members(f)
+        else:
+            yield self._origin_members(self._origin)
+
+    @staticmethod
+    def _origin_members(fileobj):
+        """seek back to the start, returns (fileobj, size) of
+        everything before the end of archive marker
+        """
+        start = fileobj.tell()
+        origin_tar = tarfile.TarFile(fileobj=fileobj)
+        # only headers are read, data of members is seeked over
+        origin_tar.getmembers()
+        fileobj.seek(start)
+        return fileobj, origin_tar.offset - start
+
+    def _iter_paths(self):
+        """files to add and everything under them,
+        in the same order as `TarFile.add`
+        """
+        for fname in self._files_to_add:
+            yield fname
+            if os.path.isdir(fname):
+                for path in self._iter_dir(fname):
+                    yield path
+
+    def _iter_dir(self, dirname):
+        with os.scandir(dirname) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        for entry in entries:
+            yield entry.path
+            if entry.is_dir():
+                for path in self._iter_dir(entry.path):
+                    yield path
+
+    def _load(self, path, max_size):
+        """returns (path, tarinfo, content), content is only read
+        for regular files no larger than `max_size`,
+        tarinfo is None if the file is left out
+        """
+        info = self._tar_obj.gettarinfo(path)
+        if info is not None and self._manifest is not None:
+            if self._manifest.unchanged(path, info.name, info.isreg()):
+                return path, None, None
+        if info is None or not info.isreg() or info.size > max_size:
+            return path, info, None
+        with open(path, "rb") as f:
+            data = f.read(info.size)
+        if len(data) < info.size:
+            raise OSError("unexpected end of data")
+        return path, info, data
+
+    def _prefetch_files(self):
+        """`_load` upcoming files in worker threads, results come out
+        in order, files too large for their share of `prefetch_bytes`
+        are only stated ahead
+        """
+        ahead = self._prefetch * PREFETCH_AHEAD
+        max_size = self._prefetch_bytes // ahead
+        window = collections.deque()
+        with concurrent.futures.ThreadPoolExecutor(self._prefetch) as pool:
+            try:
+                for path in self._iter_paths():
+                    window.append(pool.submit(self._load, path, max_size))
+                    if len(window) >= ahead:
+                        yield window.popleft().result()
+                while window:
+                    yield window.popleft().result()
+            finally:
+                for future in window:
+                    future.cancel()
+
+    def _iter_parts(self):
+        """yields the tar as bytes of headers and paddings,
+        and (fileobj, size) of data to be copied from fileobj
+        """
+        tar_obj = self._tar_obj
+        offset = 0
+        if self._origin is not None:
+            for part in self._iter_origin():
+                offset += part[1]
+                yield part
+
+        for info, fileobj in self._iter_members():
+            header = info.tobuf(
+                tar_obj.format, tar_obj.encoding, tar_obj.errors
+            )
+            offset += len(header)
+            yield header
+            if fileobj is None or not info.size:
+                continue
+
+            padding = -info.size % tarfile.BLOCKSIZE
+            offset += info.size + padding
+            yield fileobj, info.size
+            if padding:
+                yield tarfile.NUL * padding
+
+        end = tarfile.NUL * (tarfile.BLOCKSIZE * 2)
+        offset += len(end)
+        yield end + tarfile.NUL * (-offset % tarfile.RECORDSIZE)
+        if self._manifest is not None:
+            self._manifest.save()
+
+    def _iter_blocks(self):
+        """yields the tar in chunks of around `CHUNK_SIZE`"""
+        pieces = []
+        size = 0
+        for part in self._iter_parts():
+            if isinstance(part, bytes):
+                chunks = [part]
+            else:
+                chunks = self._read_payload(*part)
+            for chunk in chunks:
+                # small members come out together with their headers
+                pieces.append(chunk)
+                size += len(chunk)
+                if size >= CHUNK_SIZE:
+                    yield b"".join(pieces) if len(pieces) > 1 else chunk
+                    pieces = []
+                    size = 0
+        yield b"".join(pieces)
+
+    @staticmethod
+    def _read_payload(fileobj, left):
+        while left:
+            chunk = fileobj.read(min(left, CHUNK_SIZE))
+            if not chunk:
+                raise OSError("unexpected end of data")
+            left -= len(chunk)
+            yield chunk
+
+    def generate_to(self, fd):
+        """write the tar to a file or a blocking socket, file data is
+        moved by the kernel with `os.copy_file_range` or `os.sendfile`
+        where possible, copied through python otherwise
 
-        self._tar_obj.close()
-        yield self._tar_buffer.read()
+        data is only offloaded with `stream=True` and no compression,
+        the rest goes through `generate`
+
+        :param fd: file descriptor, or object with a `fileno()`
+        returns bytes written
+
+        ..Usage::
+
+            >>> with open("/tmp/foo.tar", "wb") as f:
+            ...     tg.generate_to(f)
+            ...
+        """
+        if not isinstance(fd, int):
+            fd = fd.fileno()
+        if not self._stream or self._compression is not None:
+            written = 0
+            for data in self.generate():
+                written += _write_all(fd, data)
+            return written
+
+        if self._generated:
+            raise ShCmdError("tar is streamed, nothing is kept")
+        to_file = stat.S_ISREG(os.fstat(fd).st_mode)
+        written = 0
+        for part in self._iter_parts():
+            if isinstance(part, bytes):
+                written += _write_all(fd, part)
+            else:
+                written += _send(part[0], part[1], fd, to_file)
         self._generated = True
+        return written
+
+    @property
+    def deleted(self):
+        """names in the manifest no longer found, None without manifest"""
+        if self._manifest is None:
+            return None
+        return self._manifest.deleted
 
     @property
     def generated(self):
@@ -113,6 +552,8 @@ class TarGenerator(object):
     @property
     def tar(self):
         """tar in bytes format"""
+        if self._stream:
+            return b"".join(self.generate())
         if not self.generated:
             for data in self.generate():
                 pass
@@ -0,0 +1,197 @@
+# -*- coding: utf8 -*-
+
+import collections
+import concurrent.futures
+import io
+import logging
+import os
+import tarfile
+
+from .errors import ShCmdError
+from .tar import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+PENDING_AHEAD = 4
+PENDING_BYTES = 64 * 1024 * 1024
+# no setuid, setgid, sticky, nor write for group and others
+SAFE_MODE = 0o755
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    a readable file object over an iterable of bytes chunks,
+    chunks are pulled one at a time, when they are needed
+
+    :param chunks: iterable of bytes, like `Proc.iter_content()`
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._data = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        while not self._data:
+            try:
+                self._data = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        size = min(len(buf), len(self._data))
+        buf[:size] = self._data[:size]
+        self._data = self._data[size:]
+        return size
+
+
+def _inside(root, path):
+    return path == root or path.startswith(root + os.sep)
+
+
+class TarExtractor(object):
+    """
+    extract a tar stream to a dir as it arrives, members are written
+    one by one, memory does not grow with the size of the archive
+
+    compressed streams (gz, bz2, xz) are detected, members that would
+    end up outside the dir, absolute ones, `..` or links pointing out,
+    are refused with `ShCmdError`, modes are masked with `SAFE_MODE`
+
+    Usage::
+
+        >>> proc = run(["ssh", "host", "tar", "cf", "-", "app"], stream=True)
+        >>> TarExtractor("/srv").extract(proc.iter_content())
+
+    """
+
+    def __init__(self, path, workers=0, pending_bytes=PENDING_BYTES):
+        """
+        :param path: dir to extract to, created if not exists
+        :param workers: (optional) default 0, number of threads that
+            write small files while later members are being received
+        :param pending_bytes: (optional) max bytes of file content
+            waiting to be written by workers, 64MB by default
+        """
+        self.path = path
+        self._workers = workers
+        self._pending_bytes = pending_bytes
+
+    def extract(self, chunks):
+        """extract everything in the stream
+
+        :param chunks: iterable of bytes, or a readable file object
+        """
+        if not hasattr(chunks, "read"):
+            chunks = io.BufferedReader(ChunkReader(chunks), CHUNK_SIZE)
+        os.makedirs(self.path, exist_ok=True)
+        root = os.path.realpath(self.path)
+
+        dirs = []
+        # target: (size, future) of files written by workers, oldest first
+        pending = collections.OrderedDict()
+        pending_bytes = 0
+
+        def wait(max_bytes):
+            nonlocal pending_bytes
+            while pending and pending_bytes > max_bytes:
+                __, (size, future) = pending.popitem(last=False)
+                future.result()
+                pending_bytes -= size
+
+        pool = None
+        if self._workers:
+            pool = concurrent.futures.ThreadPoolExecutor(self._workers)
+            max_size = self._pending_bytes // (self._workers * PENDING_AHEAD)
+        try:
+            tar_obj = tarfile.open(fileobj=chunks, mode="r|*")
+            while True:
+                info = tar_obj.next()
+                if info is None:
+                    break
+                # members are only read once, do not keep them
+                tar_obj.members = []
+                target = self._target(root, info.name)
+
+                if info.isdir():
+                    if os.path.islink(target):
+                        # never make, or chmod, a dir through a link
+                        os.unlink(target)
+                    os.makedirs(target, exist_ok=True)
+                    dirs.append((target, info))
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if info.islnk() or target in pending:
+                    # the file linked to, or overwritten, must be finished
+                    wait(0)
+                if os.path.islink(target) or info.issym() or info.islnk():
+                    # never write through, or over, an existing link
+                    if os.path.lexists(target):
+                        os.unlink(target)
+
+                if info.isreg():
+                    fileobj = tar_obj.extractfile(info)
+                    if pool is not None and info.size <= max_size:
+                        wait(self._pending_bytes - info.size)
+                        pending[target] = info.size, pool.submit(
+                            _write_file, target, info,
+                            io.BytesIO(fileobj.read())
+                        )
+                        pending_bytes += info.size
+                    else:
+                        _write_file(target, info, fileobj)
+                elif info.issym():
+                    self._check_link(root, target, info)
+                    os.symlink(info.linkname, target)
+                elif info.islnk():
+                    os.link(self._target(root, info.linkname), target)
+                else:
+                    logger.info("[{0}] skipped, type {1!r}".format(
+                        info.name, info.type
+                    ))
+            wait(0)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        # writing files into them changes the mtime, set it at the end
+        for target, info in reversed(dirs):
+            # a later member may have replaced the dir with a link
+            if not os.path.islink(target) and _inside(
+                root, os.path.realpath(target)
+            ):
+                _set_attrs(target, info)
+
+    @staticmethod
+    def _target(root, name):
+        """where member `name` goes, refuses anything outside root"""
+        parent, basename = os.path.split(name.rstrip("/"))
+        parent = os.path.realpath(os.path.join(root, parent))
+        target = os.path.join(parent, basename) if basename else parent
+        if os.path.isabs(name) or basename == ".." or not _inside(
+            root, parent
+        ):
+            raise ShCmdError("unsafe member [{0}] refused".format(name))
+        return target
+
+    @staticmethod
+    def _check_link(root, target, info):
+        source = os.path.realpath(
+            os.path.join(os.path.dirname(target), info.linkname)
+        )
+        if os.path.isabs(info.linkname) or not _inside(root, source):
+            raise ShCmdError("unsafe link [{0}] -> [{1}] refused".format(
+                info.name, info.linkname
+            ))
+
+
+def _write_file(target, info, fileobj):
+    with open(target, "wb") as f:
+        for data in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+            f.write(data)
+    _set_attrs(target, info)
+
+
+def _set_attrs(target, info):
+    os.chmod(target, info.mode & SAFE_MODE)
+    os.utime(target, (info.mtime, info.mtime))
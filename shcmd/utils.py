@@ -1,5 +1,6 @@
 # -*- coding: utf8 -*-
 
+import codecs
 import shlex
 
 
@@ -14,3 +15,69 @@ def expand_args(cmd_args):
     else:
         args_list = shlex.split(cmd_args)
     return args_list
+
+
+class LineSplitter(object):
+    """
+    split a stream of bytes chunks into lines, the line breaks
+    (\\n, \\r\\n or \\r) are stripped
+
+    unlike `str.splitlines`, the other unicode breaks (\\x0b, \\x0c,
+    \\x1c-\\x1e, \\x85, \\u2028, \\u2029) are kept inside lines, so text
+    and bytes lines are split the same way
+
+    lines are found by scanning bytes and decoded one by one through an
+    incremental decoder, so multi-byte chars across chunks are safe.
+    the codec has to be ascii compatible (utf8, latin1, gbk...)
+
+    :param codec: codec to decode lines with, None to keep lines in bytes
+
+    Usage::
+
+        >>> splitter = LineSplitter("utf8")
+        >>> splitter.feed(b"foo\\nba")
+        ['foo']
+        >>> splitter.feed(b"r\\n")
+        ['bar']
+        >>> splitter.flush()
+        []
+    """
+
+    def __init__(self, codec=None):
+        self._pending = []
+        if codec is None:
+            self._decoder = None
+        else:
+            self._decoder = codecs.getincrementaldecoder(codec)()
+
+    def feed(self, chunk):
+        """returns a list of lines completed by `chunk`"""
+        if b"\n" not in chunk and b"\r" not in chunk:
+            self._pending.append(chunk)
+            return []
+        if self._pending:
+            self._pending.append(chunk)
+            chunk = b"".join(self._pending)
+            self._pending = []
+
+        lines = chunk.splitlines(True)
+        # a trailing "\r" may be the first half of "\r\n"
+        if not lines[-1].endswith(b"\n"):
+            self._pending.append(lines.pop())
+        return [self._strip(line) for line in lines]
+
+    def flush(self):
+        """returns the lines left in buffer, call it when stream ends"""
+        remain = b"".join(self._pending)
+        self._pending = []
+        lines = [self._strip(line) for line in remain.splitlines(True)]
+        if self._decoder is not None:
+            tail = self._decoder.decode(b"", final=True)
+            if tail:
+                lines.append(tail)
+        return lines
+
+    def _strip(self, line):
+        if self._decoder is None:
+            return line.rstrip(b"\r\n")
+        return self._decoder.decode(line).rstrip("\r\n")
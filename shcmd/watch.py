@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import math
+import os
+import select
+import struct
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+FILE_EVENTS = IN_MODIFY | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF
+DIR_EVENTS = IN_CREATE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM
+
+EVENT_HEADER = struct.Struct("iIII")
+# seconds an inotify wait may block, to see writes made by other hosts
+# on network filesystems, which inotify never reports
+RESCAN_INTERVAL = 5
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [
+        ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32
+    ]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+_libc = _load_libc()
+
+
+def inotify_available():
+    """`True` if inotify can be used on this platform"""
+    return _libc is not None
+
+
+class PollWaiter(object):
+    """
+    wait for file changes by sleeping `delay` seconds,
+    works everywhere
+
+    :param delay: seconds to sleep in each wait
+    """
+
+    def __init__(self, delay):
+        self._delay = delay
+
+    def watch(self, path):
+        pass
+
+    def watch_dir(self, dirname):
+        pass
+
+    def unwatch(self, path):
+        pass
+
+    def wait(self, timeout=None):
+        """sleep, returns None since nothing is known about what changed"""
+        logger.debug("no data, waiting for [{0}]s".format(self._delay))
+        time.sleep(self._delay if timeout is None else min(
+            self._delay, max(timeout, 0)
+        ))
+        return None
+
+    def close(self):
+        pass
+
+
+class InotifyWaiter(object):
+    """
+    wait for file changes with linux inotify,
+    wakes up exactly when a watched file is written, truncated,
+    moved or deleted, or a file is created in its dir
+
+    writes made by other hosts on network filesystems are never
+    reported, with `max_wait` a wait never blocks longer than that,
+    and returns None as if events were lost when it is cut short
+
+    :param max_wait: (optional) max seconds to block in each wait
+
+    Usage::
+
+        >>> waiter = InotifyWaiter()
+        >>> waiter.watch("/var/log/syslog")
+        >>> changed = waiter.wait(10)
+        >>> waiter.close()
+
+    """
+
+    def __init__(self, max_wait=None):
+        self._max_wait = max_wait
+        self._fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # select can not take fds above FD_SETSIZE, poll can
+        self._poll = select.poll()
+        self._poll.register(self._fd, select.POLLIN)
+        self._paths = {}
+        self._dirs = {}
+        self._watches = {}
+
+    def fileno(self):
+        return self._fd
+
+    def _add_watch(self, path, mask):
+        wd = _libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def watch(self, path):
+        """watch a file, and its dir for replacement or creation"""
+        path = os.path.abspath(path)
+        self.watch_dir(os.path.dirname(path))
+        try:
+            wd = self._add_watch(path, FILE_EVENTS)
+        except FileNotFoundError:
+            return
+        self._paths[wd] = path
+        self._watches[path] = wd
+
+    def watch_dir(self, dirname):
+        """watch files created or moved into a dir"""
+        dirname = os.path.abspath(dirname)
+        if dirname in self._watches:
+            return
+        try:
+            wd = self._add_watch(dirname, DIR_EVENTS)
+        except FileNotFoundError:
+            return
+        self._dirs[wd] = dirname
+        self._watches[dirname] = wd
+
+    def unwatch(self, path):
+        wd = self._watches.pop(os.path.abspath(path), None)
+        if wd is not None:
+            self._paths.pop(wd, None)
+            _libc.inotify_rm_watch(self._fd, wd)
+
+    def wait(self, timeout=None):
+        """
+        block until something changed or timeout,
+        returns the set of changed paths, or None if events were lost
+        """
+        capped = self._max_wait is not None and (
+            timeout is None or timeout > self._max_wait
+        )
+        if capped:
+            timeout = self._max_wait
+        if timeout is not None:
+            timeout = int(math.ceil(max(timeout, 0) * 1000))
+        if not self._poll.poll(timeout):
+            return None if capped else set()
+        return self._read_events()
+
+    def _read_events(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, __, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    changed = None
+                elif changed is None:
+                    continue
+                elif wd in self._paths:
+                    path = self._paths[wd]
+                    changed.add(path)
+                    if mask & IN_IGNORED:
+                        del self._paths[wd]
+                        if self._watches.get(path) == wd:
+                            del self._watches[path]
+                elif wd in self._dirs and name:
+                    changed.add(
+                        os.path.join(self._dirs[wd], os.fsdecode(name))
+                    )
+            if changed is None:
+                return None
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def new_waiter(delay, inotify=True):
+    """inotify waiter if available, otherwise a waiter polls every delay,
+    an inotify waiter also wakes up every `RESCAN_INTERVAL` seconds
+    to see unreported changes
+    """
+    if inotify and inotify_available():
+        try:
+            return InotifyWaiter(RESCAN_INTERVAL)
+        except OSError as e:
+            logger.info("inotify unavailable: {0}".format(e))
+    return PollWaiter(delay)
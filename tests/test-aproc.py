@@ -0,0 +1,78 @@
+# -*- coding: utf8 -*-
+
+import asyncio
+import os
+import subprocess
+
+from nose import tools
+
+import shcmd
+from shcmd.aproc import AsyncProc
+from shcmd.errors import ShCmdError
+
+
+def test_arun():
+    proc = asyncio.run(shcmd.arun(["echo", "foo"]))
+    tools.eq_(proc.stdout, "foo\n")
+    tools.eq_(proc.return_code, 0)
+    proc.raise_for_error()
+
+
+def test_iter_lines():
+    async def collect():
+        proc = await shcmd.arun(["printf", "foo\\nbar"], stream=True)
+        lines = [line async for line in proc.iter_lines()]
+        # run again, replayed from the finished proc
+        chunks = [chunk async for chunk in proc.iter_content(1)]
+        return proc, lines, chunks
+
+    proc, lines, chunks = asyncio.run(collect())
+    tools.eq_(lines, ["foo", "bar"])
+    tools.eq_(b"".join(chunks), b"foo\nbar")
+    tools.eq_(proc.ok, True)
+
+
+def test_no_timeout():
+    async def collect():
+        proc = AsyncProc(["echo", "foo"], "/", os.environ, timeout=None)
+        return [chunk async for chunk in proc.iter_content()]
+
+    tools.eq_(asyncio.run(collect()), [b"foo\n"])
+
+
+def test_concurrent():
+    async def run_all():
+        return await asyncio.gather(*[
+            shcmd.arun(["sh", "-c", "sleep 0.2; echo {0}".format(i)])
+            for i in range(20)
+        ])
+
+    procs = asyncio.run(run_all())
+    tools.eq_([proc.stdout for proc in procs], [
+        "{0}\n".format(i) for i in range(20)
+    ])
+
+
+def test_input():
+    chunks = (b"x" * 65536 for __ in range(64))
+    proc = asyncio.run(shcmd.arun("wc -c", input=chunks, timeout=10))
+    tools.eq_(proc.stdout.strip(), str(64 * 65536))
+
+
+@tools.raises(ValueError)
+def test_input_error():
+    def chunks():
+        yield b"foo\n"
+        raise ValueError("broken input")
+
+    asyncio.run(shcmd.arun("wc -l", input=chunks(), timeout=10))
+
+
+@tools.raises(ShCmdError)
+def test_error():
+    asyncio.run(shcmd.arun("ls -alh   /no/such/dir"))
+
+
+@tools.raises(subprocess.TimeoutExpired)
+def test_timeout():
+    asyncio.run(shcmd.arun("sleep 5", timeout=0.1))
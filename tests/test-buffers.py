@@ -0,0 +1,59 @@
+# -*- coding: utf8 -*-
+
+from nose import tools
+
+import shcmd.buffers
+
+
+def test_chunk_buffer():
+    buf = shcmd.buffers.ChunkBuffer()
+    tools.eq_(buf.getvalue(), b"")
+    for chunk in (b"foo", b"bar", b"baz"):
+        buf.write(chunk)
+    tools.eq_(buf.getvalue(), b"foobarbaz")
+    buf.write(b"!")
+    tools.eq_(buf.getvalue(), b"foobarbaz!")
+
+
+def test_spill_buffer():
+    buf = shcmd.buffers.SpillBuffer(8)
+    buf.write(b"foo")
+    buf.write(b"bar")
+    tools.ok_(not buf.spilled)
+    tools.eq_(buf.getvalue(), b"foobar")
+
+    buf.write(b"baz")
+    tools.ok_(buf.spilled)
+    value = buf.getvalue()
+    tools.eq_(len(value), 9)
+    tools.eq_(value[:], b"foobarbaz")
+    tools.eq_(str(value, "utf8"), "foobarbaz")
+
+
+def test_tail_buffer():
+    data = b"foo\nbar\nbaz\n"
+    cases = [
+        (dict(maxbytes=5), b"\nbaz\n"),
+        (dict(maxbytes=100), data),
+        (dict(maxlines=2), b"bar\nbaz\n"),
+        (dict(maxlines=5), data),
+        (dict(maxbytes=6, maxlines=2), b"r\nbaz\n"),
+    ]
+    for kwargs, correct in cases:
+        buf = shcmd.buffers.TailBuffer(**kwargs)
+        for offset in range(len(data)):
+            buf.write(data[offset:offset + 1])
+        tools.eq_(buf.getvalue(), correct)
+
+    # memory stays bounded
+    buf = shcmd.buffers.TailBuffer(maxlines=1)
+    for __ in range(10000):
+        buf.write(b"line\n")
+    tools.eq_(len(buf._chunks), 2)
+    tools.eq_(buf.getvalue(), b"line\n")
+
+
+def test_null_buffer():
+    buf = shcmd.buffers.NullBuffer()
+    buf.write(b"foo")
+    tools.eq_(buf.getvalue(), b"")
@@ -0,0 +1,36 @@
+import os
+import tempfile
+import time
+import uuid
+
+from nose import tools
+
+from shcmd.checkpoint import Checkpoint
+
+
+def test_checkpoint():
+    tmp = os.path.realpath(tempfile.gettempdir())
+    path = os.path.join(tmp, uuid.uuid4().hex)
+    try:
+        checkpoint = Checkpoint(path, interval=0.05)
+        tools.eq_(checkpoint.get("/foo"), None)
+        tools.ok_(not checkpoint.due)
+
+        checkpoint.update("/foo", (1, 2), 3)
+        tools.eq_(checkpoint.get("/foo"), ((1, 2), 3))
+        tools.ok_(not os.path.isfile(path))
+
+        time.sleep(0.05)
+        tools.ok_(checkpoint.due)
+        checkpoint.flush()
+        tools.ok_(not checkpoint.due)
+        tools.eq_(Checkpoint(path).get("/foo"), ((1, 2), 3))
+
+        # unchanged offsets are not written again
+        mtime = os.stat(path).st_mtime_ns
+        checkpoint.update("/foo", (1, 2), 3)
+        checkpoint.close()
+        tools.eq_(os.stat(path).st_mtime_ns, mtime)
+    finally:
+        if os.path.isfile(path):
+            os.remove(path)
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import uuid
+
+from nose import tools
+
+from shcmd.manifest import Manifest
+
+
+def test_manifest():
+    tmp = os.path.realpath(tempfile.gettempdir())
+    path = os.path.join(tmp, uuid.uuid4().hex)
+    fname = os.path.join(tmp, uuid.uuid4().hex)
+    try:
+        with open(fname, "wb") as f:
+            f.write(b"foo")
+        manifest = Manifest(path)
+        tools.ok_(not manifest.unchanged(fname, "foo", True))
+        manifest.save()
+        tools.eq_(manifest.deleted, [])
+
+        for hash in (False, True):
+            manifest = Manifest(path, hash=hash)
+            tools.ok_(manifest.unchanged(fname, "foo", True))
+            tools.eq_(manifest.deleted, [])
+            manifest.save()
+
+        # touched but the same, only found unchanged by hash
+        os.utime(fname, ns=(0, 0))
+        tools.ok_(not Manifest(path).unchanged(fname, "foo", True))
+        manifest = Manifest(path, hash=True)
+        tools.ok_(manifest.unchanged(fname, "foo", True))
+        tools.eq_(manifest.deleted, [])
+
+        manifest = Manifest(path)
+        manifest.save()
+        tools.eq_(manifest.deleted, ["foo"])
+    finally:
+        for name in (path, fname):
+            if os.path.isfile(name):
+                os.remove(name)
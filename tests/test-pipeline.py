@@ -0,0 +1,56 @@
+# -*- coding: utf8 -*-
+
+import subprocess
+
+from nose import tools
+
+import shcmd
+from shcmd.errors import ShCmdError
+
+
+def test_pipe():
+    proc = shcmd.pipe("printf 'foo\\nbar\\nbaz\\n'", "grep ba", "sort -r")
+    tools.eq_(proc.stdout, "baz\nbar\n")
+    tools.eq_(proc.return_codes, [0, 0, 0])
+    tools.eq_(proc.stages, [
+        ["printf", "foo\\nbar\\nbaz\\n"], ["grep", "ba"], ["sort", "-r"]
+    ])
+    tools.eq_(proc.cmd[2], "|")
+    tools.ok_(proc.ok)
+
+
+def test_stream():
+    proc = shcmd.pipe(
+        ["head", "-c", "1000000", "/dev/zero"], ["tr", "\\0", "a"],
+        stream=True
+    )
+    size = sum(len(chunk) for chunk in proc.iter_content())
+    tools.eq_(size, 1000000)
+    tools.eq_(list(proc.iter_lines()), ["a" * 1000000])
+
+
+def test_input():
+    proc = shcmd.pipe("sort", "uniq", input=iter(["b\n", "a\n", "b\n"]))
+    tools.eq_(proc.stdout, "a\nb\n")
+
+
+def test_pipefail():
+    proc = shcmd.pipe("ls /no/such/dir", "cat", "true", warn_only=True)
+    tools.eq_(proc.return_codes, [2, 0, 0])
+    tools.eq_(proc.return_code, 2)
+    tools.ok_(not proc.ok)
+
+
+def test_stderr():
+    proc = shcmd.pipe("sh -c 'echo foo >&2'", "sh -c 'echo bar >&2'")
+    tools.eq_(sorted(proc.stderr.splitlines()), ["bar", "foo"])
+
+
+@tools.raises(ShCmdError)
+def test_error():
+    shcmd.pipe("true", "false", "true")
+
+
+@tools.raises(subprocess.TimeoutExpired)
+def test_timeout():
+    shcmd.pipe("sleep 5", "cat", timeout=0.1)
@@ -1,6 +1,7 @@
 # -*- coding: utf8 -*-
 
 import os
+import shutil
 import tempfile
 import subprocess
 import uuid
@@ -10,6 +11,7 @@ import nose
 
 import shcmd
 from shcmd.errors import ShCmdError
+from shcmd.proc import spawn_options
 
 
 from nose import tools
@@ -66,6 +68,30 @@ class TestRun(object):
                 tools.ok_(len(d) <= 100)
             tools.eq_(mock_p.mock_calls, [])
 
+    def test_spawn_options(self):
+        bindir = tempfile.mkdtemp()
+        try:
+            env = {"PATH": bindir + os.pathsep + os.defpath}
+            options = spawn_options(["ls"], self.tmp, env)
+            tools.eq_(options["cwd"], self.tmp)
+            # no cwd asked for, subprocess can take posix_spawn
+            tools.eq_(spawn_options(["ls"], None, env)["cwd"], None)
+            tools.eq_(shcmd.run("pwd").stdout.strip(), os.getcwd())
+
+            # a cached executable removed later is resolved again
+            shadow = os.path.join(bindir, "ls")
+            shutil.copy(shutil.which("ls"), shadow)
+            env = {"PATH": bindir}
+            tools.eq_(spawn_options(["ls"], "/", env)["executable"], shadow)
+            os.remove(shadow)
+            tools.ok_("executable" not in spawn_options(["ls"], "/", env))
+        finally:
+            shutil.rmtree(bindir)
+
+    def test_no_timeout(self):
+        proc = shcmd.Proc(["echo", "foo"], "/", os.environ, timeout=None)
+        tools.eq_(b"".join(proc.iter_content()), b"foo\n")
+
     def test_iter_lines(self):
         # run once
         proc = shcmd.run(self.ls_cmd, stream=True)
@@ -87,6 +113,108 @@ class TestRun(object):
             tools.ok_(random_files.issubset(ls_result))
             tools.eq_(mock_p.mock_calls, [])
 
+    def test_iter_lines_bytes(self):
+        proc = shcmd.run(["printf", "foo\\nbar"], stream=True)
+        tools.eq_(
+            list(proc.iter_lines(chunk_size=1, decode_unicode=False)),
+            [b"foo", b"bar"]
+        )
+
+    def test_iter_output(self):
+        # more stderr than a pipe buffer can hold
+        proc = shcmd.run(
+            ["sh", "-c", "head -c 200000 /dev/zero >&2; echo done"],
+            timeout=5,
+            stream=True
+        )
+        received = {"stdout": b"", "stderr": b""}
+        for stream, chunk in proc.iter_output():
+            received[stream] += chunk
+        tools.eq_(received["stdout"], b"done\n")
+        tools.eq_(received["stderr"], b"\0" * 200000)
+        tools.eq_(proc.content, b"done\n")
+        tools.eq_(proc.return_code, 0)
+
+    def test_no_capture(self):
+        proc = shcmd.run(self.ls_cmd, stream=True, capture=False)
+        data = b"".join(d for d in proc.iter_content())
+        tools.ok_(data)
+        tools.eq_(proc.content, b"")
+        tools.eq_(proc.return_code, 0)
+
+        proc = shcmd.run(self.ls_cmd, capture=False)
+        tools.eq_(proc.stdout, "")
+        tools.eq_(proc.return_code, 0)
+
+    def test_input(self):
+        proc = shcmd.run("cat", input=b"foo")
+        tools.eq_(proc.stdout, "foo")
+
+        # more than pipe buffers in both directions, never all in memory
+        chunks = (b"x" * 65536 for __ in range(64))
+        proc = shcmd.run("cat", input=chunks, timeout=10, stream=True)
+        size = sum(len(chunk) for chunk in proc.iter_content())
+        tools.eq_(size, 64 * 65536)
+
+        with open(self.ramdom_files[0], "rb") as f:
+            proc = shcmd.run("cat", input=f, capture=False)
+            tools.eq_(proc.return_code, 0)
+        with open(self.ramdom_files[0], "rt") as f:
+            proc = shcmd.run("wc -c", input=f)
+            tools.eq_(proc.stdout.strip(), "8")
+
+        # the command does not read its input at all
+        proc = shcmd.run("true", input=iter([b"x" * 1000000]))
+        tools.eq_(proc.return_code, 0)
+
+    def test_spill(self):
+        cmd = ["head", "-c", "100000", "/dev/zero"]
+        proc = shcmd.run(cmd, spill_threshold=1024)
+        tools.eq_(len(proc.content), 100000)
+        tools.ok_(not isinstance(proc.content, bytes))
+        tools.eq_(proc.content[-10:], b"\0" * 10)
+        tools.eq_(proc.stderr, "")
+
+        proc = shcmd.run(cmd, spill_threshold=1024, stream=True)
+        for d in proc.iter_content(4096):
+            tools.ok_(len(d) <= 4096)
+        tools.eq_(proc.stdout, "\0" * 100000)
+
+        # only the tail of spilled output is logged on error
+        proc = shcmd.run(
+            ["sh", "-c", "head -c 1000000 /dev/zero; exit 1"],
+            spill_threshold=1024, warn_only=True
+        )
+        with mock.patch("shcmd.proc.logger") as mock_logger:
+            try:
+                proc.raise_for_error()
+            except ShCmdError:
+                pass
+        logged = mock_logger.error.call_args[0][0]
+        tools.ok_(len(logged) < 1000000)
+        tools.ok_("bytes skipped" in logged)
+
+        proc = shcmd.run(cmd, spill_threshold=1000000)
+        tools.eq_(proc.content, b"\0" * 100000)
+
+    def test_keep_tail(self):
+        cmd = ["seq", "1000"]
+        proc = shcmd.run(cmd, keep_tail_lines=2, stream=True)
+        tools.eq_(len(list(proc.iter_lines())), 1000)
+        tools.eq_(proc.stdout, "999\n1000\n")
+
+        proc = shcmd.run(cmd, keep_tail=3)
+        tools.eq_(proc.content, b"00\n")
+
+    @tools.raises(ShCmdError)
+    def test_keep_tail_multibyte_error(self):
+        # 3 bytes of "é" * 5 start in the middle of a char
+        proc = shcmd.run(
+            ["sh", "-c", "printf ééééé; exit 1"], keep_tail=3, warn_only=True
+        )
+        tools.eq_(proc.content, "é".encode("utf8")[1:] + "é".encode("utf8"))
+        proc.raise_for_error()
+
     @mock.patch("subprocess.Popen")
     def test_output(self, mock_p):
         mock_popen = mock.MagicMock()
@@ -124,3 +252,43 @@ class TestRun(object):
         proc = shcmd.run("grep X", timeout=0.1, stream=True)
         for data in proc.iter_content(1):
             tools.eq_(data, b"")
+
+
+class TestRunMany(object):
+    def test_ordered(self):
+        cmds = [
+            ["sh", "-c", "sleep 0.{0}; echo {0}".format(3 - i)]
+            for i in range(3)
+        ]
+        procs = list(shcmd.run_many(cmds, concurrency=3))
+        tools.eq_([proc.stdout for proc in procs], ["3\n", "2\n", "1\n"])
+
+    def test_completed(self):
+        cmds = [
+            dict(cmd="sh -c 'sleep 0.{0}; pwd'".format(3 - i), cwd="/")
+            for i in range(3)
+        ]
+        procs = list(shcmd.run_many(cmds, concurrency=3, ordered=False))
+        tools.eq_(
+            [proc.cmd[-1] for proc in procs],
+            ["sleep 0.1; pwd", "sleep 0.2; pwd", "sleep 0.3; pwd"]
+        )
+        tools.eq_([proc.stdout for proc in procs], ["/\n"] * 3)
+
+    def test_warn_only(self):
+        cmds = ["ls /no/such/dir", "true", dict(cmd="sleep 5", timeout=0.1)]
+        procs = list(shcmd.run_many(cmds, warn_only=True))
+        tools.eq_([proc.ok for proc in procs], [False, True, False])
+        tools.eq_(procs[2].state, "timeouted")
+
+    @tools.raises(ShCmdError)
+    def test_fail_fast(self):
+        cmds = ["true", "ls /no/such/dir", "true"]
+        for proc in shcmd.run_many(cmds, concurrency=1):
+            tools.ok_(proc.ok)
+
+    @tools.timed(2)
+    @tools.raises(ShCmdError)
+    def test_fail_fast_kills(self):
+        # commands still running are killed, not waited for
+        list(shcmd.run_many(["false", "sleep 5"], concurrency=2))
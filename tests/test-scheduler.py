@@ -0,0 +1,45 @@
+# -*- coding: utf8 -*-
+
+import threading
+import time
+
+from nose import tools
+
+from shcmd.scheduler import Scheduler
+
+
+def test_schedule():
+    scheduler = Scheduler()
+    called = []
+    done = threading.Event()
+    scheduler.schedule(0.1, called.append, "late")
+    scheduler.schedule(0.05, called.append, "early")
+    scheduler.schedule(0.15, done.set)
+    tools.ok_(done.wait(1))
+    tools.eq_(called, ["early", "late"])
+    tools.eq_(len(scheduler), 0)
+
+
+def test_cancel():
+    scheduler = Scheduler()
+    called = []
+    handles = [
+        scheduler.schedule(0.05, called.append, i) for i in range(10)
+    ]
+    for handle in handles[1:]:
+        scheduler.cancel(handle)
+    tools.eq_(len(scheduler), 1)
+    time.sleep(0.2)
+    tools.eq_(called, [0])
+    # cancel after called is harmless
+    scheduler.cancel(handles[0])
+    tools.eq_(len(scheduler), 0)
+
+
+def test_single_thread():
+    scheduler = Scheduler()
+    before = threading.active_count()
+    handles = [scheduler.schedule(60, print) for __ in range(100)]
+    tools.eq_(threading.active_count(), before + 1)
+    for handle in handles:
+        scheduler.cancel(handle)
@@ -1,9 +1,16 @@
 import logging
 import os
+import shutil
+import tempfile
 import time
 import threading
 
-from shcmd import tailf
+import mock
+from nose import tools
+
+from shcmd import tailf, tailf_batches, tailf_many
+from shcmd.checkpoint import Checkpoint
+from shcmd.tailf import Follower, lastn_offset
 
 
 __curdir__ = os.path.dirname(os.path.realpath(__file__))
@@ -17,6 +24,14 @@ def remove_file():
 
 
 def test_tailf():
+    check_tailf(inotify=True)
+
+
+def test_tailf_polling():
+    check_tailf(inotify=False)
+
+
+def check_tailf(inotify):
     def fake_writer():
         try:
             with open(TEST_FILE, "at") as f:
@@ -44,10 +59,252 @@ def test_tailf():
                 TEST_FILE,
                 delay=0.01,
                 stopon=lambda x: x == "stop\n",
-                timeout=0.5
+                timeout=0.5,
+                inotify=inotify
             )
         ]
         logging.debug("result is {0}".format(result))
         assert result == ["foo\n", "bar\n", "third\n", "stop\n"]
     finally:
         remove_file()
+
+
+def test_tailf_many():
+    check_tailf_many(inotify=True)
+
+
+def test_tailf_many_polling():
+    check_tailf_many(inotify=False)
+
+
+def check_tailf_many(inotify):
+    tmpdir = tempfile.mkdtemp()
+    first = os.path.join(tmpdir, "first.log")
+    second = os.path.join(tmpdir, "second.log")
+
+    def fake_writer():
+        time.sleep(0.05)
+        with open(first, "at") as f:
+            f.write("foo\n")
+        time.sleep(0.05)
+        with open(second, "wt") as f:
+            f.write("bar\n")
+        time.sleep(0.05)
+        with open(first, "at") as f:
+            f.write("stop\n")
+
+    try:
+        with open(first, "wt") as f:
+            f.write("old\nlast\n")
+        with open(os.path.join(tmpdir, "other.txt"), "wt") as f:
+            f.write("ignored\n")
+        writer = threading.Thread(target=fake_writer)
+        writer.start()
+        result = list(tailf_many(
+            [os.path.join(tmpdir, "*.log")],
+            lastn=1,
+            delay=0.01,
+            stopon=lambda x: x == "stop\n",
+            inotify=inotify
+        ))
+        writer.join()
+        assert result == [
+            (first, "last"),
+            (first, "foo\n"),
+            (second, "bar\n"),
+            (first, "stop\n")
+        ], result
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_lastn():
+    contents = [
+        "", "\n", "foo", "foo\n", "foo\nbar", "foo\r\nbar\r\n\r\nbaz\n",
+        "上海\n崇明\r岛\n\n", "\n\n\nfoo\n\n"
+    ]
+    try:
+        for content in contents:
+            with open(TEST_FILE, "wt", encoding="utf8", newline="") as f:
+                f.write(content)
+            with open(TEST_FILE, "rt", encoding="utf8") as f:
+                lines = [line.rstrip() for line in f]
+            for lastn in range(6):
+                correct = lines[max(0, len(lines) - lastn):]
+                follower = Follower(TEST_FILE, "utf8")
+                try:
+                    assert follower.lastn(lastn) == correct, (content, lastn)
+                    assert follower.readline() == ""
+                finally:
+                    follower.close()
+
+        # more blocks than one
+        with open(TEST_FILE, "wb") as f:
+            f.write(b"".join(b"%d\n" % i for i in range(100000)))
+        with open(TEST_FILE, "rb") as f:
+            offset = lastn_offset(f, 3, block_size=7)
+            f.seek(offset)
+            assert f.read() == b"99997\n99998\n99999\n"
+    finally:
+        remove_file()
+
+
+def test_rotation():
+    rotated = TEST_FILE + ".1"
+
+    def fake_writer():
+        with open(TEST_FILE, "at") as f:
+            time.sleep(0.05)
+            f.write("foo\n")
+            f.flush()
+            time.sleep(0.05)
+            os.rename(TEST_FILE, rotated)
+            f.write("bar\n")
+        time.sleep(0.05)
+        with open(TEST_FILE, "wt") as f:
+            f.write("baz\n")
+            f.write("stop\n")
+
+    for inotify in (True, False):
+        try:
+            with open(TEST_FILE, "wt") as f:
+                f.write("old\n")
+            writer = threading.Thread(target=fake_writer)
+            writer.start()
+            result = list(tailf(
+                TEST_FILE,
+                delay=0.01,
+                stopon=lambda x: x == "stop\n",
+                inotify=inotify
+            ))
+            writer.join()
+            assert result == ["foo\n", "bar\n", "baz\n", "stop\n"], result
+        finally:
+            remove_file()
+            if os.path.isfile(rotated):
+                os.remove(rotated)
+
+
+def test_offset():
+    try:
+        with open(TEST_FILE, "wt") as f:
+            f.write("foo\nbar\nstop\n")
+        result = list(tailf(
+            TEST_FILE, offset=4, stopon=lambda x: x == "stop\n"
+        ))
+        assert result == ["bar\n", "stop\n"], result
+
+        # the file is shorter than offset, read from the beginning
+        result = list(tailf(
+            TEST_FILE, offset=100, stopon=lambda x: x == "stop\n"
+        ))
+        assert result == ["foo\n", "bar\n", "stop\n"], result
+    finally:
+        remove_file()
+
+
+def test_checkpoint():
+    checkpoint = TEST_FILE + ".checkpoint"
+
+    def follow(stop):
+        return list(tailf(
+            TEST_FILE,
+            lastn=1,
+            checkpoint=checkpoint,
+            stopon=lambda x: x == stop
+        ))
+
+    try:
+        with open(TEST_FILE, "wt") as f:
+            f.write("a\nb\n")
+        writer = threading.Timer(0.05, append_lines, ["c\n", "d\n"])
+        writer.start()
+        # nothing saved yet, starts with lastn as usual
+        assert follow("c\n") == ["b", "c\n"]
+        writer.join()
+
+        # resumes right after the last yielded line, lastn is ignored
+        append_lines("e\n")
+        assert follow("e\n") == ["d\n", "e\n"]
+
+        # replaced while nobody is following
+        os.remove(TEST_FILE)
+        append_lines("f\n")
+        assert follow("f\n") == ["f\n"]
+    finally:
+        remove_file()
+        if os.path.isfile(checkpoint):
+            os.remove(checkpoint)
+
+
+def test_batches():
+    def fake_writer():
+        time.sleep(0.05)
+        append_lines("foo\n", "ba")
+        time.sleep(0.05)
+        append_lines("r\n", "stop\n")
+
+    try:
+        with open(TEST_FILE, "wt") as f:
+            f.write("old\nlast\n")
+        writer = threading.Thread(target=fake_writer)
+        writer.start()
+        result = list(tailf_batches(
+            TEST_FILE,
+            lastn=1,
+            delay=0.01,
+            max_latency=0,
+            stopon=lambda x: "stop\n" in x
+        ))
+        writer.join()
+        assert result == [["last\n"], ["foo\n"], ["bar\n", "stop\n"]], result
+
+        # raw bytes, a batch is flushed once it is full
+        result = list(tailf_batches(
+            TEST_FILE,
+            lastn=4,
+            encoding=None,
+            batch_size=5,
+            max_latency=10,
+            stopon=lambda x: x.endswith(b"stop\n")
+        ))
+        assert result == [b"last\n", b"foo\nbar\n", b"stop\n"], result
+    finally:
+        remove_file()
+
+
+def test_checkpoint_writes():
+    checkpoint = TEST_FILE + ".checkpoint"
+
+    def fake_writer():
+        for index in range(20):
+            time.sleep(0.02)
+            append_lines("{0}\n".format(index))
+        append_lines("stop\n")
+
+    try:
+        with open(TEST_FILE, "wt"):
+            pass
+        writer = threading.Thread(target=fake_writer)
+        writer.start()
+        with mock.patch(
+            "shcmd.checkpoint.os.replace", wraps=os.replace
+        ) as mock_replace:
+            result = list(tailf(
+                TEST_FILE,
+                checkpoint=Checkpoint(checkpoint, interval=10),
+                stopon=lambda x: x == "stop\n"
+            ))
+        writer.join()
+        tools.eq_(len(result), 21)
+        # lines trickling in are not written one by one, only at the end
+        tools.eq_(mock_replace.call_count, 1)
+    finally:
+        remove_file()
+        if os.path.isfile(checkpoint):
+            os.remove(checkpoint)
+
+
+def append_lines(*lines):
+    with open(TEST_FILE, "at") as f:
+        f.writelines(lines)
@@ -1,15 +1,20 @@
 # -*- coding: utf8 -*-
 
+import errno
 import io
 import os
+import shutil
+import socket
 import tarfile
 import tempfile
+import threading
 import uuid
 
 import mock
 from nose import tools
 
 import shcmd.tar
+from shcmd.errors import ShCmdError
 
 
 class TestRun(object):
@@ -56,6 +61,24 @@ class TestRun(object):
         ]
         self._check_content(tar_data, test_cases)
 
+    def test_origin(self):
+        fd, origin_path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.old_tar)
+            with open(origin_path, "rb") as origin_file:
+                for origin in (origin_path, origin_file):
+                    tg = shcmd.tar.TarGenerator(origin, stream=True)
+                    tg.add_fileobj("bytes", b"foo")
+                    tar_data = tg.tar
+                    # header and data blocks of "old" are copied through
+                    tools.ok_(tar_data.startswith(self.old_tar[:1024]))
+                    self._check_content(tar_data, [
+                        ("old", self.old_tar_content), ("bytes", b"foo")
+                    ])
+        finally:
+            os.remove(origin_path)
+
     def test_property(self):
         tg = shcmd.tar.TarGenerator()
         tg.files_to_add = list(self.ramdom_files.keys())
@@ -67,6 +90,190 @@ class TestRun(object):
 
         tools.eq_(mock_g.mock_calls, [])
 
+    def test_stream(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            big = os.path.join(tmpdir, "big")
+            with open(big, "wb") as f:
+                f.write(os.urandom(shcmd.tar.CHUNK_SIZE * 3 + 1))
+            os.mkdir(os.path.join(tmpdir, "sub"))
+            with open(os.path.join(tmpdir, "sub", "small"), "wb") as f:
+                f.write(b"foo")
+
+            reference = io.BytesIO()
+            with tarfile.TarFile(
+                mode="w", fileobj=reference, dereference=True
+            ) as tar_obj:
+                tar_obj.add(tmpdir)
+
+            tg = shcmd.tar.TarGenerator(stream=True)
+            tg.files_to_add = [tmpdir]
+            chunks = list(tg.generate())
+            tools.eq_(b"".join(chunks), reference.getvalue())
+            tools.ok_(all(
+                len(chunk) < shcmd.tar.CHUNK_SIZE * 2
+                for chunk in chunks
+            ))
+            tools.eq_(tg._tar_buffer.tell(), 0)
+
+            # headers of many empty files are flushed as they pile up
+            empty = os.path.join(tmpdir, "empty")
+            os.mkdir(empty)
+            for index in range(2000):
+                open(os.path.join(empty, str(index)), "wb").close()
+            tg = shcmd.tar.TarGenerator(stream=True)
+            tg.files_to_add = [empty]
+            chunks = list(tg.generate())
+            tools.ok_(len(chunks) > 2000 * 512 // shcmd.tar.CHUNK_SIZE)
+            tools.ok_(all(
+                len(chunk) < shcmd.tar.CHUNK_SIZE * 2 for chunk in chunks
+            ))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_prefetch(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for index in range(50):
+                subdir = os.path.join(tmpdir, str(index % 3))
+                if not os.path.isdir(subdir):
+                    os.mkdir(subdir)
+                with open(os.path.join(subdir, str(index)), "wb") as f:
+                    f.write(os.urandom(index * 100))
+
+            reference = io.BytesIO()
+            with tarfile.TarFile(
+                mode="w", fileobj=reference, dereference=True
+            ) as tar_obj:
+                tar_obj.add(tmpdir)
+
+            # large files are not read ahead with a small prefetch_bytes
+            for prefetch_bytes in (shcmd.tar.PREFETCH_BYTES, 8 * 2000):
+                tg = shcmd.tar.TarGenerator(
+                    prefetch=2, prefetch_bytes=prefetch_bytes
+                )
+                tg.files_to_add = [tmpdir]
+                tools.eq_(tg.tar, reference.getvalue())
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_generate_to(self):
+        def new_generator(**kwargs):
+            tg = shcmd.tar.TarGenerator(self.old_tar, **kwargs)
+            tg.add_fileobj("bytes", b"foo")
+            tg.files_to_add = self.ramdom_files.keys()
+            return tg
+
+        def check_file(**kwargs):
+            with tempfile.TemporaryFile() as f:
+                written = new_generator(**kwargs).generate_to(f)
+                f.seek(0)
+                tools.eq_(f.read(), expected)
+                tools.eq_(written, len(expected))
+
+        expected = new_generator().tar
+        check_file()
+        check_file(stream=True)
+
+        # copied through python if the kernel can not do it
+        no_copy = OSError(errno.EINVAL, "not supported")
+        with mock.patch.object(
+            shcmd.tar.os, "sendfile", side_effect=no_copy
+        ), mock.patch.object(
+            shcmd.tar.os, "copy_file_range", side_effect=no_copy
+        ):
+            check_file(stream=True)
+
+        # sendfile to a socket
+        reader, writer = socket.socketpair()
+        received = []
+        receiver = threading.Thread(target=lambda: received.extend(
+            iter(lambda: reader.recv(65536), b"")
+        ))
+        receiver.start()
+        with reader, writer:
+            new_generator(stream=True).generate_to(writer)
+            writer.shutdown(socket.SHUT_WR)
+            receiver.join()
+        tools.eq_(b"".join(received), expected)
+
+    def test_manifest(self):
+        tmpdir = tempfile.mkdtemp()
+        manifest = os.path.join(tmpdir, "manifest")
+        tree = os.path.join(tmpdir, "tree")
+
+        def write(name, content):
+            with open(os.path.join(tree, name), "wb") as f:
+                f.write(content)
+
+        def members():
+            tg = shcmd.tar.TarGenerator(manifest=manifest)
+            tg.files_to_add = [tree]
+            tar_obj = tarfile.open(fileobj=tg.tar_io)
+            names = [
+                os.path.relpath("/" + name, tree)
+                for name in tar_obj.getnames()
+            ]
+            return names, tg.deleted
+
+        try:
+            os.mkdir(tree)
+            write("foo", b"foo")
+            write("bar", b"bar")
+            tools.eq_(members(), ([".", "bar", "foo"], []))
+            tools.eq_(members(), ([], []))
+
+            write("foo", b"changed")
+            os.remove(os.path.join(tree, "bar"))
+            write("baz", b"baz")
+            names, deleted = members()
+            tools.eq_(sorted(names), [".", "baz", "foo"])
+            tools.eq_(deleted, [tree[1:] + "/bar"])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    @tools.raises(ShCmdError)
+    def test_stream_once(self):
+        tg = shcmd.tar.TarGenerator(stream=True)
+        tg.add_fileobj("bytes", b"foo")
+        self._check_content(tg.tar, [("bytes", b"foo")])
+        tg.tar
+
+    def test_compression(self):
+        test_cases = list(self.ramdom_files.items()) + [
+            ("old", self.old_tar_content)
+        ]
+        for compression in ("gz", "bz2", "xz"):
+            for in_thread in (False, True):
+                tg = shcmd.tar.TarGenerator(
+                    self.old_tar,
+                    stream=True,
+                    compression=compression,
+                    compression_level=1,
+                    compress_in_thread=in_thread
+                )
+                tg.files_to_add = self.ramdom_files.keys()
+                tar_data = b"".join(tg.generate())
+                with tarfile.open(
+                    fileobj=io.BytesIO(tar_data),
+                    mode="r:{0}".format(compression)
+                ):
+                    pass
+                self._check_content(tar_data, test_cases)
+
+    @tools.raises(ShCmdError)
+    def test_compression_unavailable(self):
+        with mock.patch.object(shcmd.tar, "zstandard", None):
+            shcmd.tar.TarGenerator(compression="zst")
+
+    @tools.raises(ValueError)
+    def test_compression_error(self):
+        tg = shcmd.tar.TarGenerator(compression="gz", compress_in_thread=True)
+        tg.add_fileobj("io", io.BytesIO(b"baz"))
+        with mock.patch.object(shcmd.tar, "new_compressor") as mock_new:
+            mock_new.return_value.compress.side_effect = ValueError
+            list(tg.generate())
+
     def _check_content(self, tar_data, test_cases):
         tar_obj = tarfile.open(fileobj=io.BytesIO(tar_data))
         for (name, content) in test_cases:
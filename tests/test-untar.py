@@ -0,0 +1,121 @@
+# -*- coding: utf8 -*-
+
+import io
+import os
+import shutil
+import stat
+import tarfile
+import tempfile
+
+from nose import tools
+
+from shcmd.errors import ShCmdError
+from shcmd.tar import CHUNK_SIZE, TarGenerator
+from shcmd.untar import TarExtractor
+
+
+class TestExtract(object):
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, "src")
+        self.contents = {
+            "big": os.urandom(CHUNK_SIZE * 3 + 7),
+            "sub/small": b"foo",
+            "sub/deeper/empty": b""
+        }
+        for name, content in self.contents.items():
+            path = os.path.join(self.src, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+        os.chmod(os.path.join(self.src, "sub/small"), 0o600)
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_extract(self):
+        for workers, compression in [(0, None), (2, "gz")]:
+            tg = TarGenerator(stream=True, compression=compression)
+            tg.files_to_add = [self.src]
+            dest = os.path.join(self.tmpdir, "dest{0}".format(workers))
+            # small chunks, members span many of them
+            chunks = (
+                data[i:i + 1000]
+                for data in tg.generate()
+                for i in range(0, len(data), 1000)
+            )
+            TarExtractor(dest, workers=workers).extract(chunks)
+
+            extracted = os.path.join(dest, self.src.lstrip("/"))
+            for name, content in self.contents.items():
+                path = os.path.join(extracted, name)
+                with open(path, "rb") as f:
+                    tools.eq_(f.read(), content)
+                origin = os.stat(os.path.join(self.src, name))
+                tools.eq_(os.stat(path).st_mode, origin.st_mode)
+                tools.eq_(int(os.stat(path).st_mtime), int(origin.st_mtime))
+
+    def test_links(self):
+        tar_data = self._make_tar([
+            ("foo", tarfile.REGTYPE, b"foo"),
+            ("sub/link", tarfile.SYMTYPE, "../foo"),
+            ("hard", tarfile.LNKTYPE, "foo")
+        ])
+        dest = os.path.join(self.tmpdir, "dest")
+        TarExtractor(dest).extract(io.BytesIO(tar_data))
+        tools.eq_(os.readlink(os.path.join(dest, "sub/link")), "../foo")
+        with open(os.path.join(dest, "hard"), "rb") as f:
+            tools.eq_(f.read(), b"foo")
+
+    def test_unsafe_mode(self):
+        tar_data = self._make_tar([("foo", tarfile.REGTYPE, b"foo")], 0o6777)
+        dest = os.path.join(self.tmpdir, "dest")
+        TarExtractor(dest).extract([tar_data])
+        mode = os.stat(os.path.join(dest, "foo")).st_mode
+        tools.eq_(stat.S_IMODE(mode), 0o755)
+
+    @tools.raises(ShCmdError)
+    def test_unsafe_name(self):
+        tar_data = self._make_tar([("../evil", tarfile.REGTYPE, b"evil")])
+        TarExtractor(os.path.join(self.tmpdir, "dest")).extract([tar_data])
+
+    @tools.raises(ShCmdError)
+    def test_unsafe_link(self):
+        tar_data = self._make_tar([
+            ("link", tarfile.SYMTYPE, "../.."),
+        ])
+        TarExtractor(os.path.join(self.tmpdir, "dest")).extract([tar_data])
+
+    @tools.raises(ShCmdError)
+    def test_through_link(self):
+        dest = os.path.join(self.tmpdir, "dest")
+        os.mkdir(dest)
+        os.symlink(self.src, os.path.join(dest, "link"))
+        tar_data = self._make_tar([("link/evil", tarfile.REGTYPE, b"evil")])
+        TarExtractor(dest).extract([tar_data])
+
+    def test_dir_over_link(self):
+        dest = os.path.join(self.tmpdir, "dest")
+        os.mkdir(dest)
+        os.symlink(self.src, os.path.join(dest, "link"))
+        mode = os.stat(self.src).st_mode
+        tar_data = self._make_tar([("link", tarfile.DIRTYPE, "")], 0)
+        TarExtractor(dest).extract([tar_data])
+        tools.eq_(os.stat(self.src).st_mode, mode)
+        tools.ok_(not os.path.islink(os.path.join(dest, "link")))
+        os.chmod(os.path.join(dest, "link"), 0o755)
+
+    def _make_tar(self, members, mode=0o644):
+        tar_buffer = io.BytesIO()
+        with tarfile.TarFile(mode="w", fileobj=tar_buffer) as tar_obj:
+            for name, member_type, content in members:
+                info = tarfile.TarInfo(name)
+                info.type = member_type
+                info.mode = mode
+                if member_type == tarfile.REGTYPE:
+                    info.size = len(content)
+                    tar_obj.addfile(info, io.BytesIO(content))
+                else:
+                    info.linkname = content
+                    tar_obj.addfile(info)
+        return tar_buffer.getvalue()
@@ -19,3 +19,27 @@ def test_asc_expand_args():
     # tuple
     result = shcmd.utils.expand_args(("/bin/bash", "echo", "上海崇明岛"))
     nose.tools.eq_(result, correct)
+
+
+def test_line_splitter():
+    data = "foo\r\n上海\rbar\n\nbaz".encode("utf8")
+    correct = ["foo", "上海", "bar", "", "baz"]
+    for size in (1, 2, 3, 5, len(data)):
+        splitter = shcmd.utils.LineSplitter("utf8")
+        result = []
+        for offset in range(0, len(data), size):
+            result.extend(splitter.feed(data[offset:offset + size]))
+        result.extend(splitter.flush())
+        nose.tools.eq_(result, correct)
+
+    # bytes mode
+    splitter = shcmd.utils.LineSplitter()
+    nose.tools.eq_(splitter.feed(b"foo\nbar"), [b"foo"])
+    nose.tools.eq_(splitter.flush(), [b"bar"])
+
+    # only \n, \r\n and \r break lines, not form feeds and the like
+    splitter = shcmd.utils.LineSplitter("utf8")
+    nose.tools.eq_(
+        splitter.feed("a\x0cb\x1ec\u2028d\n".encode("utf8")),
+        ["a\x0cb\x1ec\u2028d"]
+    )
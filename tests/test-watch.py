@@ -0,0 +1,75 @@
+import os
+import resource
+import tempfile
+import uuid
+
+from nose import tools
+
+from shcmd import watch
+
+
+def test_poll_waiter():
+    waiter = watch.PollWaiter(0.01)
+    waiter.watch("/no/such/file")
+    tools.eq_(waiter.wait(1), None)
+
+
+def test_inotify_waiter_high_fd():
+    soft_limit, __ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if not watch.inotify_available() or soft_limit < 1200:
+        return
+    # fds above FD_SETSIZE (1024) can not be selected
+    fds = []
+    try:
+        while not fds or fds[-1] < 1100:
+            fds.append(os.open(os.devnull, os.O_RDONLY))
+        waiter = watch.InotifyWaiter()
+        try:
+            tools.ok_(waiter.fileno() > 1024)
+            tools.eq_(waiter.wait(0.01), set())
+        finally:
+            waiter.close()
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def test_inotify_waiter():
+    if not watch.inotify_available():
+        return
+    tmp = os.path.realpath(tempfile.gettempdir())
+    fname = os.path.join(tmp, uuid.uuid4().hex)
+    created = os.path.join(tmp, uuid.uuid4().hex)
+    waiter = watch.InotifyWaiter()
+    try:
+        with open(fname, "wb"):
+            pass
+        waiter.watch(fname)
+        tools.eq_(waiter.wait(0.01), set())
+
+        with open(fname, "ab") as f:
+            f.write(b"foo")
+        tools.ok_(fname in waiter.wait(1))
+
+        with open(created, "wb"):
+            pass
+        tools.ok_(created in waiter.wait(1))
+
+        # cut short by max_wait, changes are unknown
+        capped = watch.InotifyWaiter(max_wait=0.01)
+        try:
+            tools.eq_(capped.wait(1), None)
+            tools.eq_(capped.wait(0), set())
+        finally:
+            capped.close()
+
+        # delay is for polling, inotify waits are not cut short by it
+        waiter.close()
+        waiter = watch.new_waiter(0.01)
+        waiter.watch(fname)
+        tools.eq_(waiter.wait(0.1), set())
+    finally:
+        waiter.close()
+        for path in (fname, created):
+            if os.path.isfile(path):
+                os.remove(path)